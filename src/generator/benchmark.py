@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Benchmarks of the generator pipeline on synthetic component configs.
+"""
+
+import gc
+import platform
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+import yaml
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from generator.models import Dockerfile, InfoGenerator, OpinionatedBaseModel
+from generator.utils import directives_to_layers
+
+# The InfoGenerator is appended to the RUN directive of the last component
+LIST_TYPES = ["arg", "env", "copy", "apt-get", "curl", "bash"]
+PHASES = ["yaml_load", "validate", "directives_to_layers", "to_ghelp_format", "to_dockerfile"]
+
+
+def synthetic_item(list_type: str, idx: int, copy_source: Path) -> Any:
+    if list_type == "apt-get":
+        return {"name": f"package-{idx}", "validation_command": f"package-{idx} --version"}
+    if list_type == "bash":
+        return {
+            "name": f"script-{idx}",
+            "command": f"echo {idx} > /tmp/script-{idx}\nchmod 644 /tmp/script-{idx}",
+            "info": f"synthetic script {idx}",
+        }
+    if list_type == "curl":
+        return {
+            "name": f"tool-{idx}",
+            "version": f"v1.{idx}.0",
+            "from": f"https://example.com/tool-{idx}/{{version}}/tool-linux-amd64",
+            "validation_command": f"tool-{idx} version",
+        }
+    if list_type == "copy":
+        return {"name": f"file-{idx}", "from": str(copy_source), "to": f"/opt/file-{idx}"}
+    if list_type == "env":
+        return f"VAR_{idx}=value-{idx}"
+    return f"ARG_{idx}=default-{idx}"
+
+
+def synthetic_components(items: int, per_component: int, copy_source: Path) -> list[dict]:
+    """
+    Raw component config with `items` items spread evenly over all list types,
+    at most `per_component` items per component and the list types interleaved.
+    Remaining items go to the last list types, so the config always ends with a bash component.
+    """
+    n = len(LIST_TYPES)
+    counts = [items // n + (i >= n - items % n) for i in range(n)]
+    chunks: list[list[dict]] = []
+    idx = 0
+    for list_type, count in zip(LIST_TYPES, counts):
+        components = []
+        for start in range(0, count, per_component):
+            batch = range(idx + start, idx + min(start + per_component, count))
+            components.append({
+                "name": list_type,
+                "items": [synthetic_item(list_type, i, copy_source) for i in batch],
+            })
+        chunks.append(components)
+        idx += count
+    result = []
+    for position in range(max((len(c) for c in chunks), default=0)):
+        result.extend(c[position] for c in chunks if position < len(c))
+    return result
+
+
+class PhaseResult(OpinionatedBaseModel):
+    seconds: float
+    peak_bytes: int
+
+
+class SizeResult(OpinionatedBaseModel):
+    items: int
+    components: int
+    dockerfile_bytes: int
+    phases: dict[str, PhaseResult]
+
+
+class BenchmarkReport(OpinionatedBaseModel):
+    python: str = platform.python_version()
+    repeat: int
+    results: list[SizeResult]
+
+    def size(self, items: int) -> SizeResult | None:
+        return next((r for r in self.results if r.items == items), None)
+
+
+def run_pipeline(config: str, hook: Callable[[str, Callable[[], Any]], Any]) -> str:
+    """The phases of generator.main.generate_dockerfile, each wrapped by `hook`"""
+    components = hook("yaml_load", lambda: yaml.safe_load(config))
+
+    def validate() -> Dockerfile:
+        dockerfile = Dockerfile(dockerfile_file=Path("/dev/null"), components=components)
+        dockerfile.components.append(InfoGenerator(components=components))
+        return dockerfile
+
+    dockerfile = hook("validate", validate)
+    layers = hook("directives_to_layers", lambda: directives_to_layers(dockerfile.components))
+    hook("to_ghelp_format", dockerfile.components[-1].to_ghelp_format)
+    return hook("to_dockerfile", lambda: dockerfile.to_dockerfile(layers))
+
+
+def time_phases(config: str) -> tuple[dict[str, float], str]:
+    timings: dict[str, float] = {}
+
+    def hook(phase: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = fn()
+        timings[phase] = time.perf_counter() - start
+        return result
+
+    return timings, run_pipeline(config, hook)
+
+
+def trace_phases(config: str) -> dict[str, int]:
+    """Peak memory allocated while each phase runs, measured in a separate traced run"""
+    peaks: dict[str, int] = {}
+
+    def hook(phase: str, fn: Callable[[], Any]) -> Any:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        peaks[phase] = tracemalloc.get_traced_memory()[1] - baseline
+        return result
+
+    tracemalloc.start()
+    try:
+        run_pipeline(config, hook)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def benchmark_size(items: int, per_component: int, repeat: int, copy_source: Path) -> SizeResult:
+    """Best of `repeat` timed runs plus one traced run for the memory peaks"""
+    raw = synthetic_components(items, per_component, copy_source)
+    config = yaml.safe_dump(raw, sort_keys=False)
+    best: dict[str, float] = {}
+    content = ""
+    for _ in range(repeat):
+        gc.collect()
+        timings, content = time_phases(config)
+        best = {p: min(t, best.get(p, t)) for p, t in timings.items()}
+    gc.collect()
+    peaks = trace_phases(config)
+    return SizeResult(
+        items=items,
+        components=len(raw),
+        dockerfile_bytes=len(content.encode("utf-8")),
+        phases={p: PhaseResult(seconds=round(best[p], 6), peak_bytes=peaks[p]) for p in PHASES},
+    )
+
+
+def compare_reports(previous: BenchmarkReport, current: BenchmarkReport) -> str:
+    """Per phase ratio of current to previous time and memory for the sizes in both reports"""
+    lines = ["items  phase                 time      memory"]
+    for result in current.results:
+        before = previous.size(result.items)
+        if before is None:
+            continue
+        for phase in PHASES:
+            old, new = before.phases.get(phase), result.phases[phase]
+            if old is None:
+                continue
+            time_ratio = new.seconds / old.seconds if old.seconds else 1.0
+            memory_ratio = new.peak_bytes / old.peak_bytes if old.peak_bytes else 1.0
+            lines.append(f"{result.items:<6} {phase:<20} {time_ratio:>6.2f}x  {memory_ratio:>6.2f}x")
+    return "\n".join(lines)
+
+
+class BenchmarkSettings(BaseSettings):
+    model_config = SettingsConfigDict(cli_parse_args=True, cli_kebab_case=True)
+    sizes: list[int] = [10, 1000, 50000]
+    items_per_component: int = Field(default=50, gt=0)
+    repeat: int = Field(default=3, gt=0)
+    output: Path = Path("benchmark-results.json")
+    compare: Path | None = None
+
+
+def main():
+    s = BenchmarkSettings()  # type: ignore
+    copy_source = Path(__file__)
+    results = []
+    for items in s.sizes:
+        result = benchmark_size(items, s.items_per_component, s.repeat, copy_source)
+        total = sum(p.seconds for p in result.phases.values())
+        print(f"{items} items in {result.components} components: {total:.3f}s")
+        for phase, r in result.phases.items():
+            print(f"  {phase:<20} {r.seconds:>10.4f}s {r.peak_bytes / 2**20:>10.1f} MiB")
+        results.append(result)
+
+    report = BenchmarkReport(repeat=s.repeat, results=results)
+    s.output.write_text(report.model_dump_json(indent=2) + "\n", encoding="utf-8")
+    print(f"Results written to {s.output}")
+    if s.compare:
+        print(compare_reports(BenchmarkReport.model_validate_json(s.compare.read_bytes()), report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Content fingerprints and the on-disk manifest used for incremental generation.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Iterable
+
+from pydantic import BaseModel, Field, ValidationError
+
+from generator.models import OpinionatedBaseModel
+
+
+def fingerprint_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def fingerprint_json(value: Any) -> str:
+    """Fingerprint of a JSON serialisable value, independent of key order"""
+    return fingerprint_bytes(
+        json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    )
+
+
+def fingerprint_path(path: Path) -> str:
+    """Fingerprint of a file or a directory tree, including names and file modes"""
+    if path.is_symlink():
+        return fingerprint_bytes(f"link:{path.readlink()}".encode("utf-8"))
+    if path.is_file():
+        h = hashlib.sha256(f"mode:{path.stat().st_mode & 0o777:o}\n".encode("utf-8"))
+        h.update(path.read_bytes())
+        return h.hexdigest()
+    if path.is_dir():
+        h = hashlib.sha256()
+        for entry in sorted(path.rglob("*")):
+            if entry.is_dir() and not entry.is_symlink():
+                continue
+            h.update(f"{entry.relative_to(path)}\0{fingerprint_path(entry)}\n".encode("utf-8"))
+        return h.hexdigest()
+    return "missing"
+
+
+def copy_sources(components: Any) -> list[str]:
+    """Paths referenced by the `from` key of `copy` components in a raw config"""
+    sources = []
+    for component in components or []:
+        if not isinstance(component, dict) or component.get("name") != "copy":
+            continue
+        for item in component.get("items") or []:
+            if isinstance(item, dict) and "from" in item:
+                sources.append(str(item["from"]))
+    return sources
+
+
+def fingerprint_settings(settings: BaseModel, exclude: set[str] | None = None) -> str:
+    return fingerprint_json(settings.model_dump(mode="json", exclude=exclude))
+
+
+class ManifestEntry(OpinionatedBaseModel):
+    config: str
+    settings: str
+    sources: dict[str, str] = {}
+    components: list[str] = []
+    output: str | None = None
+    files: dict[str, str] = Field(
+        default={}, description="Other files the run read or wrote, besides the config and output"
+    )
+
+    @classmethod
+    def build(
+        cls,
+        config: bytes,
+        components: Any,
+        settings: str,
+        output: str | None = None,
+        files: Iterable[Path] = (),
+    ) -> "ManifestEntry":
+        return cls(
+            config=fingerprint_bytes(config),
+            settings=settings,
+            sources={src: fingerprint_path(Path(src)) for src in copy_sources(components)},
+            files={str(path): fingerprint_path(path) for path in files},
+            components=[
+                fingerprint_json({
+                    "component": c,
+                    "sources": {src: fingerprint_path(Path(src)) for src in copy_sources([c])},
+                })
+                for c in components or []
+            ],
+            output=output,
+        )
+
+
+class Manifest(OpinionatedBaseModel):
+    entries: dict[str, ManifestEntry] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        """Load a manifest, an unreadable one is treated as empty"""
+        try:
+            return cls.model_validate_json(path.read_bytes())
+        except (OSError, ValidationError):
+            return cls()
+
+    def save(self, path: Path) -> None:
+        path.write_text(self.model_dump_json(indent=2), encoding="utf-8")
+
+    def is_fresh(self, key: str, config: bytes, settings: str, output: Path | None = None) -> bool:
+        """
+        Check whether the recorded entry still matches the config, settings, copied sources,
+        the other files read or written by the run and (if given) the previously written output file.
+        The config is only hashed, not parsed, so a fresh entry costs no YAML load.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if entry.config != fingerprint_bytes(config) or entry.settings != settings:
+            return False
+        if any(fingerprint_path(Path(src)) != digest for src, digest in entry.sources.items()):
+            return False
+        if any(fingerprint_path(Path(path)) != digest for path, digest in entry.files.items()):
+            return False
+        if output is not None:
+            if entry.output is None or not output.is_file():
+                return False
+            if fingerprint_bytes(output.read_bytes()) != entry.output:
+                return False
+        return True
+
+    def changed_components(self, key: str, entry: ManifestEntry) -> list[int]:
+        """Indices of components that differ from the recorded entry"""
+        previous = self.entries.get(key)
+        if previous is None:
+            return list(range(len(entry.components)))
+        return [
+            idx
+            for idx, digest in enumerate(entry.components)
+            if idx >= len(previous.components) or previous.components[idx] != digest
+        ]
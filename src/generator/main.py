@@ -4,98 +4,355 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import time
 import yaml
 
 from pathlib import Path
 from copy import deepcopy
-from pydantic import FilePath, ValidationError
-from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic import (
+    DirectoryPath,
+    Field,
+    FilePath,
+    TypeAdapter,
+    ValidationError,
+    model_validator,
+)
+from pydantic_settings import BaseSettings, CliImplicitFlag, SettingsConfigDict
 
-from generator.models import BaseItem, Dockerfile, InfoGenerator
-from generator.utils import directives_to_layers
+from generator import validation_runner
+from generator.incremental import (
+    Manifest,
+    ManifestEntry,
+    fingerprint_bytes,
+    fingerprint_json,
+    fingerprint_settings,
+)
+from generator.models import (
+    AptGetItemList,
+    BaseItem,
+    Dockerfile,
+    DockerfileComponent,
+    InfoGenerator,
+)
+from generator.profiling import Profiler
+from generator.snapshot import Snapshot
+from generator.utils import (
+    bake_on_demand_tools,
+    directives_to_layers,
+    format_layer_plan,
+    plan_components,
+    split_download_stages,
+)
+from generator.validation import (
+    RUNNER_STAGE,
+    CachedCheck,
+    RunnerPlan,
+    ValidationCheck,
+    load_durations,
+    load_passed_fingerprints,
+    runner_validation_lines,
+    serial_validation_lines,
+    shard_checks,
+    skip_passed_checks,
+    write_runner_files,
+)
+
+# Settings that control incremental mode, profiling and snapshots and do not influence the output
+INCREMENTAL_SETTINGS = {"incremental", "manifest", "profile", "profile_output", "snapshot"}
+
+COMPONENT_ADAPTER: TypeAdapter = TypeAdapter(DockerfileComponent)
 
 
 class ValidateSettings(BaseSettings):
     model_config = SettingsConfigDict(cli_parse_args=True, cli_kebab_case=True)
     dockerfile_config: FilePath
+    incremental: CliImplicitFlag[bool] = False
+    manifest: Path = Path(".generator-manifest.json")
+    profile: CliImplicitFlag[bool] = False
+    profile_output: Path | None = None
+    snapshot: Path | None = None
 
 
 class GeneratorSettings(ValidateSettings):
     from_image: str = "ghcr.io/gardenlinux/gardenlinux:latest"
     title: str = "gardener shell"
     dockerfile: Path
+    plan_layers: CliImplicitFlag[bool] = False
+    download_stages: CliImplicitFlag[bool] = False
+    download_stage_image: str | None = None
+    ghelp_resolve_command: str | None = None
+    ghelp_info_file: CliImplicitFlag[bool] = False
+    variant: str | None = None
+    bake: list[str] = []
+    build_context: DirectoryPath = Path(".")
+
+    @model_validator(mode="after")
+    def download_stage_image_given(self) -> "GeneratorSettings":
+        # The base image does not necessarily ship curl, tar and jq
+        if self.download_stages and not self.download_stage_image:
+            raise ValueError("--download-stages requires a --download-stage-image with curl, tar and jq")
+        return self
 
 
 class ValidationGeneratorSettings(ValidateSettings):
     from_image: str = "ops-toolbelt"
     dockerfile: Path
+    runner: CliImplicitFlag[bool] = False
+    workers: int = Field(default=4, gt=0)
+    check_timeout: float = Field(default=300, gt=0)
+    build_context: DirectoryPath = Path(".")
+    shards: int = Field(default=1, gt=0)
+    shard_index: int = Field(default=0, ge=0)
+    previous_report: FilePath | None = None
+    full: CliImplicitFlag[bool] = False
+
+    @model_validator(mode="after")
+    def shard_index_in_range(self) -> "ValidationGeneratorSettings":
+        if self.shard_index >= self.shards:
+            raise ValueError(f"--shard-index must be lower than --shards ({self.shards})")
+        return self
+
+
+def is_up_to_date(s: ValidateSettings, key: str, config: bytes, output: Path | None = None) -> bool:
+    """Check the manifest for an unchanged previous run of the same command"""
+    if not s.incremental:
+        return False
+    if not Manifest.load(s.manifest).is_fresh(
+        key, config, fingerprint_settings(s, INCREMENTAL_SETTINGS), output
+    ):
+        return False
+    print(f"Nothing changed since the last run, skipping {key}")
+    return True
+
+
+def record_run(
+    s: ValidateSettings,
+    key: str,
+    config: bytes,
+    components: list,
+    output: str | None = None,
+    files: list[Path] | None = None,
+) -> None:
+    """Record a successful run in the manifest, together with the other files it read or wrote"""
+    if not s.incremental:
+        return
+    manifest = Manifest.load(s.manifest)
+    entry = ManifestEntry.build(
+        config,
+        components,
+        fingerprint_settings(s, INCREMENTAL_SETTINGS),
+        fingerprint_bytes(output.encode("utf-8")) if output is not None else None,
+        files or [],
+    )
+    changed = manifest.changed_components(key, entry)
+    print(f"{key}: {len(changed)} of {len(entry.components)} components changed")
+    manifest.entries[key] = entry
+    manifest.save(s.manifest)
+
+
+def ghelp_info_file(dockerfile: Path) -> Path:
+    """The ghelp info is written next to the Dockerfile that copies it"""
+    return dockerfile.with_name(f"{dockerfile.stem}.ghelp_info.json")
+
+
+def validate_components(profiler: Profiler, components: list) -> list:
+    """
+    Validate components one by one while profiling, to split the validation time by
+    component type. Otherwise the raw components are left to the Dockerfile model.
+    """
+    if not profiler.enabled:
+        return components
+    return [
+        profiler.timed(
+            "components",
+            str(c.get("name")) if isinstance(c, dict) else type(c).__name__,
+            COMPONENT_ADAPTER.validate_python,
+            c,
+        )
+        for c in components or []
+    ]
+
+
+def build_dockerfile(
+    s: ValidateSettings, profiler: Profiler, config: bytes, components: list, **kwargs
+) -> Dockerfile:
+    """
+    Validate the components, or restore them without validation from a snapshot of the same
+    config. After a validation the snapshot is (re)written.
+    """
+    snapshot = Snapshot.load(s.snapshot) if s.snapshot else None
+    if snapshot is not None and snapshot.matches(config):
+        with profiler.phase("snapshot restore"):
+            return Dockerfile.model_construct(components=snapshot.restore(), **kwargs)
+    with profiler.phase("validation"):
+        dockerfile = Dockerfile(components=validate_components(profiler, components), **kwargs)
+    if s.snapshot:
+        Snapshot.build(config, components, dockerfile.components).save(s.snapshot)
+    return dockerfile
 
 
 def validate():
+    started = time.perf_counter()
     s = ValidateSettings()  # type: ignore
-    with open(s.dockerfile_config, encoding="utf-8") as f:
+    with Profiler.run("generator-validate", started, s.profile, s.profile_output) as profiler:
+        key = f"generator-validate:{s.dockerfile_config}"
+        config = s.dockerfile_config.read_bytes()
+        if is_up_to_date(s, key, config):
+            return
+        with profiler.phase("yaml.safe_load"):
+            components = yaml.safe_load(config)
         try:
-            Dockerfile(
-                dockerfile_file=Path("/dev/null"),
-                components=yaml.safe_load(f),
-            )
+            build_dockerfile(s, profiler, config, components, dockerfile_file=Path("/dev/null"))
         except ValidationError as e:
             print(f"Invalid configuration in {s.dockerfile_config}")
             raise e
+        record_run(s, key, config, components)
 
 
 def generate_dockerfile():
+    started = time.perf_counter()
     s = GeneratorSettings()  # type: ignore
-    with open(s.dockerfile_config, encoding="utf-8") as f:
-        components = yaml.safe_load(f)
-    dockerfile = Dockerfile(
-        dockerfile_file=s.dockerfile,
-        components=components,
-        from_image=s.from_image,
-        title=s.title,
-    )
-    info_generator = InfoGenerator(components=components)
-    dockerfile.components.append(info_generator)
-
-    with open(dockerfile.dockerfile_file, "w", encoding="utf-8") as cf:
-        cf.write(
-            dockerfile.to_dockerfile(
-                directives_to_layers(dockerfile.components)
-            )
+    with Profiler.run("generator", started, s.profile, s.profile_output) as profiler:
+        key = f"generator:{s.dockerfile}"
+        config = s.dockerfile_config.read_bytes()
+        if is_up_to_date(s, key, config, s.dockerfile):
+            return
+        with profiler.phase("yaml.safe_load"):
+            components = yaml.safe_load(config)
+        dockerfile = build_dockerfile(
+            s,
+            profiler,
+            config,
+            components,
+            dockerfile_file=s.dockerfile,
+            from_image=s.from_image,
+            title=s.title,
         )
+        info_file = ghelp_info_file(s.dockerfile) if s.ghelp_info_file else None
+        info_source = (
+            info_file.resolve().relative_to(s.build_context.resolve()).as_posix() if info_file else None
+        )
+        with profiler.phase("validation (ghelp info)"):
+            if s.snapshot:
+                # The components passed validation above or in the run that wrote the snapshot
+                info_generator = InfoGenerator.model_construct(
+                    components=list(dockerfile.components),
+                    resolve_command=s.ghelp_resolve_command,
+                    info_file=info_source,
+                ).copy_info_file()
+            else:
+                info_generator = InfoGenerator(
+                    components=components, resolve_command=s.ghelp_resolve_command, info_file=info_source
+                )
+        dockerfile.components.append(info_generator)
+        if s.plan_layers:
+            with profiler.phase("layer planning"):
+                planned = plan_components(dockerfile.components)
+            print(format_layer_plan(dockerfile.components, planned))
+            dockerfile.components = planned
 
+        with profiler.phase("on-demand tools"):
+            dockerfile.components = bake_on_demand_tools(dockerfile.components, s.variant, s.bake)
 
-def collect_validation_commands(components: list) -> list[tuple[str, str]]:
-    """Walk all components and collect (name, validation_command) from items."""
+        stages: list[str] = []
+        if s.download_stages:
+            with profiler.phase("download stages"):
+                stages, dockerfile.components = split_download_stages(
+                    dockerfile.components, s.download_stage_image
+                )
+
+        with profiler.phase("layer grouping"):
+            layers = directives_to_layers(dockerfile.components)
+        with profiler.phase("file emission"):
+            content = dockerfile.to_dockerfile(layers, stages)
+            with open(dockerfile.dockerfile_file, "w", encoding="utf-8") as cf:
+                cf.write(content)
+            if info_file is not None:
+                info_file.write_text(info_generator.to_ghelp_json(), encoding="utf-8")
+        record_run(s, key, config, components, content, [info_file] if info_file else [])
+
+
+def collect_validation_checks(components: list, from_image: str = "") -> list[ValidationCheck]:
+    """
+    Walk all components and collect the validation checks of their items.
+    The fingerprint of a check covers the base image, all apt-get components (unversioned
+    packages follow the distribution) and the components installed before the item.
+    """
+    context = fingerprint_json({
+        "from_image": from_image,
+        "apt-get": [c.fingerprint() for c in components if isinstance(c, AptGetItemList)],
+    })
     result = []
     for component in components:
         if not hasattr(component, "items"):
             continue
         for item in component.items:
             if isinstance(item, BaseItem) and item.validation_command:
-                result.append((item.name, item.validation_command))
+                result.append(
+                    ValidationCheck(
+                        name=item.name,
+                        command=item.validation_command,
+                        fingerprint=item.fingerprint(context),
+                    )
+                )
+        context = fingerprint_json([context, component.fingerprint()])
     return result
 
 
+def collect_validation_commands(components: list) -> list[tuple[str, str]]:
+    """Walk all components and collect (name, validation_command) from items."""
+    return [(check.name, check.command) for check in collect_validation_checks(components)]
+
+
 def generate_validation_dockerfile():
+    started = time.perf_counter()
     s = ValidationGeneratorSettings()  # type: ignore
-    with open(s.dockerfile_config, encoding="utf-8") as f:
-        components = yaml.safe_load(f)
-    dockerfile = Dockerfile(
-        dockerfile_file=s.dockerfile,
-        components=components,
-        from_image=s.from_image,
-    )
+    with Profiler.run("generator-validation-dockerfile", started, s.profile, s.profile_output) as profiler:
+        key = f"generator-validation-dockerfile:{s.dockerfile}"
+        config = s.dockerfile_config.read_bytes()
+        if is_up_to_date(s, key, config, s.dockerfile):
+            return
+        with profiler.phase("yaml.safe_load"):
+            components = yaml.safe_load(config)
+        dockerfile = build_dockerfile(
+            s, profiler, config, components, dockerfile_file=s.dockerfile, from_image=s.from_image
+        )
 
-    validation_commands = collect_validation_commands(dockerfile.components)
+        with profiler.phase("check selection"):
+            checks = collect_validation_checks(dockerfile.components, s.from_image)
+            durations = load_durations(s.previous_report) if s.previous_report else None
+            cached: list[CachedCheck] = []
+            if s.previous_report and not s.full:
+                checks, skipped = skip_passed_checks(checks, load_passed_fingerprints(s.previous_report))
+                print(f"Skipping {len(skipped)} checks that passed with an unchanged definition")
+                cached = [
+                    CachedCheck(**check.model_dump(), duration=(durations or {}).get(check.key, 0.0))
+                    for check in skipped
+                ]
+            if s.shards > 1:
+                checks, estimate = shard_checks(checks, s.shards, s.shard_index, durations)
+                cached = shard_checks(cached, s.shards, s.shard_index, durations)[0]
+                print(
+                    f"Shard {s.shard_index + 1}/{s.shards}: {len(checks)} checks, "
+                    f"estimated {estimate:.1f}s"
+                )
 
-    lines = [
-        f"FROM {s.from_image}",
-        'SHELL ["/bin/bash", "-lic"]',
-    ]
-    for name, cmd in validation_commands:
-        lines.append(f"# Validate: {name}")
-        lines.append(f"RUN {cmd}")
+        with profiler.phase("file emission"):
+            lines = [
+                f"FROM {s.from_image} AS {RUNNER_STAGE}" if s.runner else f"FROM {s.from_image}",
+                'SHELL ["/bin/bash", "-lic"]',
+            ]
+            files = [s.previous_report] if s.previous_report else []
+            if s.runner:
+                plan = RunnerPlan(workers=s.workers, timeout=s.check_timeout, checks=checks, cached=cached)
+                runner_files = write_runner_files(plan, s.dockerfile)
+                lines.extend(runner_validation_lines(*runner_files, s.build_context))
+                # The runner is copied from the package, which may change independently of its copy
+                files.extend([*runner_files, Path(validation_runner.__file__)])
+            else:
+                lines.extend(serial_validation_lines(checks))
 
-    with open(s.dockerfile, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines) + "\n")
+            content = "\n".join(lines) + "\n"
+            with open(s.dockerfile, "w", encoding="utf-8") as f:
+                f.write(content)
+        record_run(s, key, config, components, content, files)
@@ -10,8 +10,9 @@ Models for the generator package.
 
 import re
 import json
+import hashlib
 from pathlib import Path
-from typing import Annotated, Any, Literal
+from typing import Annotated, Any, Collection, Literal
 from pydantic_core import core_schema
 from functools import partial
 from pydantic import (
@@ -59,9 +60,24 @@ def ensure_env_pair(value: str) -> str:
     return value
 
 
+def ghelp_tokens(text: str) -> set[str]:
+    """
+    Lowercase search tokens of a text: every word and, for compound words like `vim-tiny`,
+    also their parts. hacks/ghelp tokenizes queries the same way.
+    """
+    tokens = set()
+    for word in re.findall(r"[a-z0-9]+(?:[-_.+/][a-z0-9]+)*", text.replace("\\n", " ").lower()):
+        tokens.add(word)
+        tokens.update(re.split(r"[-_.+/]", word))
+    return {t for t in tokens if len(t) > 1}
+
+
 command_multiline_string_validator = partial(multiline_string_validator, prefix="    ", suffix=";\\")
 info_multiline_string_validator = partial(multiline_string_validator, prefix="", suffix="", joiner="\\n")
 
+GHELP_INFO_PATH = "/var/lib/ghelp_info"
+GHELP_INFO_MOUNT = "/tmp/ghelp_info.json"
+
 SupportedDockerfileCommands = Literal["ARG", "RUN", "ENV", "COPY"]
 PackageNameString = Annotated[str, AfterValidator(package_name_string_validator)]
 CommandString = Annotated[str, AfterValidator(command_multiline_string_validator)]
@@ -79,10 +95,42 @@ class BaseItem(OpinionatedBaseModel):
     def dump_ghelp(self) -> tuple[PackageNameString, str | None, InfoString]:
         return self.name, getattr(self, 'version', None), self.info
 
+    def fingerprint(self, context: str = "") -> str:
+        """
+        Digest of everything that influences the outcome of the validation_command.
+        Copied files are hashed by content; `context` is the digest of the base image and
+        the components the item is installed on top of.
+        """
+        # incremental imports this module
+        from generator.incremental import fingerprint_path
+
+        source = getattr(self, "source", None)
+        fields = {
+            "name": self.name,
+            "version": getattr(self, "version", None),
+            "source": fingerprint_path(source) if isinstance(source, Path) else source,
+            "command": getattr(self, "command", None),
+            "validation_command": self.validation_command,
+            "context": context,
+        }
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
 
 class BaseDockerfileDirective(OpinionatedBaseModel):
     key: SupportedDockerfileCommands
     can_be_combined: bool = True
+    reorderable: bool = Field(
+        default=False,
+        description="The layer planner may move the component towards the end of the image",
+    )
+    after: list[str] = Field(
+        default=[],
+        description="Names of components or of their items that have to come earlier in the image",
+    )
+    before: list[str] = Field(
+        default=[],
+        description="Names of components or of their items that have to come later in the image",
+    )
 
     def to_shortened_dockerfile_directive(self) -> str:
         """Only the command part of the dockerfile directive"""
@@ -98,6 +146,15 @@ class BaseDockerfileDirective(OpinionatedBaseModel):
             raise NotImplementedError(f"{self.__class__.__name__} must have 'items' attribute.")
         return [item.dump_ghelp() for item in self.items]  # type: ignore
 
+    def fingerprint(self) -> str:
+        """Digest of the items of the directive, see BaseItem.fingerprint"""
+        items = [
+            item.fingerprint() if isinstance(item, BaseItem) else item
+            for item in getattr(self, "items", [])
+        ]
+        fields = {"key": self.key, "name": getattr(self, "name", None), "items": items}
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
 
 class BashItem(BaseItem):
     command: CommandString
@@ -139,6 +196,51 @@ class AptGetItem(BaseItem):
         return self.name, self.provides
 
 
+class AptAccelerationProfile(OpinionatedBaseModel):
+    """Opt-in BuildKit and apt settings that speed up rebuilds of an apt-get layer"""
+    cache_mounts: bool = Field(
+        default=True,
+        description="Keep /var/cache/apt and /var/lib/apt/lists in BuildKit cache mounts",
+    )
+    proxy_arg: str | None = Field(
+        default=None,
+        pattern=r"^[A-Za-z_][A-Za-z0-9_]*$",
+        description="Build ARG holding an optional caching proxy or mirror URL for apt",
+    )
+    no_install_recommends: bool = False
+    pipeline_depth: int | None = Field(
+        default=None,
+        gt=0,
+        description="Number of pipelined HTTP requests apt keeps in flight per host",
+    )
+
+    @property
+    def needs_own_layer(self) -> bool:
+        """Mount flags and ARG declarations only work at the start of a RUN directive"""
+        return self.cache_mounts or self.proxy_arg is not None
+
+    def apt_get_options(self) -> list[str]:
+        options = []
+        if self.cache_mounts:
+            options.append("-o APT::Keep-Downloaded-Packages=true")
+        if self.pipeline_depth:
+            options.append(f"-o Acquire::http::Pipeline-Depth={self.pipeline_depth}")
+        if self.proxy_arg:
+            arg = self.proxy_arg
+            options.append(
+                f"${{{arg}:+-o Acquire::http::Proxy=${{{arg}}} -o Acquire::https::Proxy=${{{arg}}}}}"
+            )
+        return options
+
+    def run_flags(self) -> str:
+        if not self.cache_mounts:
+            return ""
+        return "".join(
+            f"--mount=type=cache,target={target},sharing=locked "
+            for target in ("/var/cache/apt", "/var/lib/apt/lists")
+        )
+
+
 class AptGetItemList(BaseDockerfileDirective):
     name: Literal["apt-get"]
     items: list[AptGetItem | PackageNameString]
@@ -147,17 +249,42 @@ class AptGetItemList(BaseDockerfileDirective):
         default="apt-get --yes update && apt-get --yes install",
         alias="apt-get-command",
     )
+    acceleration: AptAccelerationProfile | None = None
+
+    @model_validator(mode="after")
+    def start_own_layer_if_accelerated(self) -> "AptGetItemList":
+        if self.acceleration is not None and self.acceleration.needs_own_layer:
+            self.can_be_combined = False
+        return self
 
     def to_shortened_dockerfile_directive(self) -> str:
-        return (
-            f"{self.apt_get_command} "
-            + " ".join(
-                item.name if isinstance(item, AptGetItem) else item
-                for item in self.items
-            )
-            + """;\\
-    rm -rf /var/lib/apt/lists"""
+        packages = " ".join(
+            item.name if isinstance(item, AptGetItem) else item
+            for item in self.items
         )
+        if self.acceleration is None:
+            return f"{self.apt_get_command} {packages}" + """;\\
+    rm -rf /var/lib/apt/lists"""
+
+        command = self.apt_get_command
+        options = self.acceleration.apt_get_options()
+        if options:
+            command = re.sub(r"\bapt-get\b", f"apt-get {' '.join(options)}", command)
+        if self.acceleration.no_install_recommends:
+            command = f"{command} --no-install-recommends"
+        if not self.acceleration.cache_mounts:
+            return f"{command} {packages}" + """;\\
+    rm -rf /var/lib/apt/lists"""
+        # The package lists live in a cache mount and never end up in the layer
+        return "rm -f /etc/apt/apt.conf.d/docker-clean;\\\n    " + f"{command} {packages}"
+
+    def to_dockerfile_directive(self) -> str:
+        if self.acceleration is None:
+            return super().to_dockerfile_directive()
+        directive = f"{self.key} {self.acceleration.run_flags()}{self.to_shortened_dockerfile_directive()}"
+        if self.acceleration.proxy_arg:
+            return f"ARG {self.acceleration.proxy_arg}\n{directive}"
+        return directive
 
     def to_ghelp_format(self) -> list:
         """Convert items to ghelp format"""
@@ -213,6 +340,10 @@ class CurlItem(BashItem):
     source: ShellAwareHttpUrl = Field(alias="from")
     to: Path
     command: CommandString = ""
+    artifacts: list[Path] = Field(
+        default=[],
+        description="Files produced by the download and its command, defaults to `to`",
+    )
 
     @model_validator(mode="before")
     @classmethod
@@ -241,6 +372,26 @@ class CurlItem(BashItem):
         """Dump ghelp format for curl item"""
         return self.name, self.version or None, self.info or None
 
+    @property
+    def stage_name(self) -> str:
+        return "download-" + re.sub(r"[^a-z0-9]+", "-", self.name.lower()).strip("-")
+
+    def to_download_stage(self, from_image: str, args: list[str]) -> str:
+        """
+        Build stage that runs the download and its command in isolation. Like the final image it
+        runs as root in /, whatever user and working directory the stage image sets.
+        """
+        lines = [f"FROM {from_image} AS {self.stage_name}", "USER root", "WORKDIR /"]
+        lines.extend(f"ARG {arg}" for arg in args)
+        lines.append(f"RUN {self.command}")
+        return "\n".join(lines)
+
+    def to_copy_from_stage_directive(self) -> str:
+        return "\n".join(
+            f"COPY --from={self.stage_name} {artifact} {artifact}"
+            for artifact in self.artifacts or [self.to]
+        )
+
 
 class CurlItemList(BaseDockerfileDirective):
     name: Literal["curl"]
@@ -253,6 +404,26 @@ class CurlItemList(BaseDockerfileDirective):
     def to_ghelp_format(self) -> list:
         return [i.dump_ghelp() for i in self.items]
 
+    def to_download_stages(self, from_image: str, args: list[str]) -> list[str]:
+        return [item.to_download_stage(from_image, args) for item in self.items]
+
+
+class CurlStageCopyList(BaseDockerfileDirective):
+    """Copies the artifacts of the download stages of a CurlItemList into the final image"""
+    name: Literal["curl-stages"] = "curl-stages"
+    items: list[CurlItem]
+    key: SupportedDockerfileCommands = "COPY"
+    can_be_combined: bool = False
+
+    def to_shortened_dockerfile_directive(self) -> str:
+        return "\n".join(item.to_copy_from_stage_directive() for item in self.items)
+
+    def to_dockerfile_directive(self) -> str:
+        return self.to_shortened_dockerfile_directive()
+
+    def to_ghelp_format(self) -> list:
+        return [i.dump_ghelp() for i in self.items]
+
 
 EnvString = Annotated[str, AfterValidator(ensure_env_pair)]
 
@@ -266,11 +437,50 @@ class EnvItemList(BaseDockerfileDirective):
         return " ".join(self.items)
 
 
+class OnDemandTool(OpinionatedBaseModel):
+    """Tool that a copied install script downloads when it is used for the first time"""
+    binary: str
+    download_mb: float | None = Field(default=None, gt=0, description="Approximate size of the download")
+    install_seconds: float | None = Field(
+        default=None, gt=0, description="Approximate duration of the install"
+    )
+    version: str | None = Field(
+        default=None, description="Version installed when the tool is baked, required to bake it"
+    )
+    bake: bool = Field(default=False, description="Install the tool while building the image")
+    bake_variants: list[str] = Field(default=[], description="Image variants that bake the tool")
+
+    @model_validator(mode="after")
+    def require_version_when_baked(self) -> "OnDemandTool":
+        if (self.bake or self.bake_variants) and not self.version:
+            raise ValueError(f"{self.binary} is baked into the image and needs a pinned version")
+        return self
+
+    def baked(self, variant: str | None, bake: Collection[str] = ()) -> bool:
+        return self.bake or self.binary in bake or (variant is not None and variant in self.bake_variants)
+
+
+def script_description(path: Path) -> str | None:
+    """First comment of a script after its shebang and license header"""
+    with path.open("r", errors="replace") as f:
+        for _, line in zip(range(20), f):
+            text = line.strip()
+            if text.startswith("#!") or text.startswith("# SPDX") or text in ("", "#"):
+                continue
+            if not text.startswith("#"):
+                return None
+            return text.lstrip("#").strip() or None
+    return None
+
+
 class CopyItem(BaseItem):
     source: FilePath | DirectoryPath = Field(alias="from")
     to: Path
     command: str = Field(default="", description="Arguments for COPY directive")
     key: SupportedDockerfileCommands = "COPY"
+    on_demand: OnDemandTool | None = Field(
+        default=None, description="The copied script installs this tool at runtime"
+    )
 
     @field_validator("command", mode="after")
     @classmethod
@@ -283,6 +493,31 @@ class CopyItem(BaseItem):
     def to_dockerfile_directive(self) -> str:
         return f"{self.key}{self.command} {self.source} {self.to}"
 
+    @property
+    def target(self) -> Path:
+        """Image path of a copied file"""
+        return self.to if self.to.name == self.source.name else self.to / self.source.name
+
+    def copied_scripts(self) -> list[tuple[Path, Path]]:
+        """Source and image path of the executable files the item copies, directories are walked"""
+        if self.source.is_dir():
+            files = sorted(f for f in self.source.rglob("*") if f.is_file())
+            targets = [(f, self.to / f.relative_to(self.source)) for f in files]
+        else:
+            targets = [(self.source, self.target)]
+        return [(src, to) for src, to in targets if src.stat().st_mode & 0o111]
+
+    def copies_executable(self) -> bool:
+        return self.source.is_file() and bool(self.source.stat().st_mode & 0o111)
+
+    def bake_command(self) -> str:
+        """Runs the copied install script of an on-demand tool during the image build"""
+        if self.on_demand is None:
+            raise ValueError(f"{self.name} does not install an on-demand tool")
+        if self.on_demand.version:
+            return f"{self.target} --version {self.on_demand.version}"
+        return str(self.target)
+
 
 class CopyItemList(BaseDockerfileDirective):
     name: Literal["copy"]
@@ -296,6 +531,13 @@ class CopyItemList(BaseDockerfileDirective):
     def to_dockerfile_directive(self) -> str:
         return self.to_shortened_dockerfile_directive()
 
+    def to_ghelp_format(self) -> list:
+        """
+        Only copied executables are tools. Sourced libraries like install-lib are left out, and the
+        scripts of copied directories are listed by InfoGenerator.on_demand_registry.
+        """
+        return [item.dump_ghelp() for item in self.items if item.copies_executable()]
+
 
 class ArgItemList(BaseDockerfileDirective):
     name: Literal["arg"]
@@ -333,10 +575,33 @@ class InfoGenerator(OpinionatedBaseModel):
         ]
     ]
     can_be_combined: bool = True
+    resolve_command: str | None = Field(
+        default=None,
+        description="Command run after writing the ghelp info, resolves package metadata in the image",
+    )
+    info_file: str | None = Field(
+        default=None,
+        description="Build context path of the generated ghelp info, copied instead of echoed in a RUN",
+    )
+
+    @model_validator(mode="after")
+    def copy_info_file(self) -> "InfoGenerator":
+        """
+        A copied ghelp info gets a layer of its own, metadata changes rebuild only that one.
+        With a resolve command the file is bind mounted into the RUN that resolves it,
+        so that no separate COPY layer is rebuilt as well.
+        """
+        if self.info_file is not None:
+            self.key = "RUN" if self.resolve_command else "COPY"
+            self.can_be_combined = False
+        return self
 
     def to_ghelp_format(self) -> dict:
-        """Convert components to ghelp.json format"""
-        result = {"apt": [], "pip": [], "downloaded": []}
+        """
+        Convert components to ghelp.json format, together with an inverted index that maps
+        search tokens of names, provided binaries and info texts to [section, tool] pairs
+        """
+        result: dict = {"apt": [], "pip": [], "downloaded": []}
 
         for component in self.components:
             if isinstance(component, AptGetItemList):
@@ -349,28 +614,97 @@ class InfoGenerator(OpinionatedBaseModel):
                 result["downloaded"].extend(component.to_ghelp_format())
                 continue
 
+        result["index"] = self.ghelp_index(result)
+        result.update(self.on_demand_registry({row[0] for row in result["downloaded"]}))
         return result
 
+    def on_demand_registry(self, listed: set[str]) -> dict[str, list[dict]]:
+        """
+        Tools installed on demand and the scripts copied into the image that are not listed otherwise.
+        ghelp tells whether an on-demand tool is installed by looking for its binary.
+        """
+        on_demand: list[dict] = []
+        scripts: dict[str, dict] = {}
+        for component in self.components:
+            if not isinstance(component, CopyItemList):
+                continue
+            for item in component.items:
+                for src, to in item.copied_scripts():
+                    if item.on_demand is not None and src == item.source:
+                        on_demand.append({
+                            "name": item.on_demand.binary,
+                            "installer": str(to),
+                            "bytes": src.stat().st_size,
+                            "download_mb": item.on_demand.download_mb,
+                            "install_seconds": item.on_demand.install_seconds,
+                            "info": item.info,
+                        })
+                    if src.name in listed or src.name in scripts:
+                        continue
+                    info = item.info if src == item.source else None
+                    scripts[src.name] = {
+                        "name": src.name,
+                        "path": str(to),
+                        "bytes": src.stat().st_size,
+                        "info": info or script_description(src),
+                    }
+        return {"on_demand": on_demand, "hacks": list(scripts.values())}
+
+    @staticmethod
+    def ghelp_index(sections: dict) -> dict[str, list[list[str]]]:
+        index: dict[str, list[list[str]]] = {}
+        for section, rows in sections.items():
+            for row in rows:
+                if section == "downloaded":
+                    tool, texts = row[0], [row[0], row[2] or ""]
+                else:
+                    # Package rows are shown with the binaries they provide
+                    binaries = row[1] if isinstance(row[1], list) else [row[1]]
+                    tool, texts = " ".join(binaries), [row[0], *binaries]
+                for token in sorted(set().union(*(ghelp_tokens(t) for t in texts))):
+                    if [section, tool] not in index.setdefault(token, []):
+                        index[token].append([section, tool])
+        return dict(sorted(index.items()))
+
+    def to_ghelp_json(self) -> str:
+        return json.dumps(self.to_ghelp_format())
+
     def to_shortened_dockerfile_directive(self) -> str:
-        return f"echo '{json.dumps(self.to_ghelp_format())}' > /var/lib/ghelp_info"
+        if self.info_file is not None and not self.resolve_command:
+            return f"{self.info_file} {GHELP_INFO_PATH}"
+        if self.info_file is not None:
+            directive = (
+                f"--mount=type=bind,source={self.info_file},target={GHELP_INFO_MOUNT} "
+                f"cp {GHELP_INFO_MOUNT} {GHELP_INFO_PATH}"
+            )
+        else:
+            directive = f"echo '{self.to_ghelp_json()}' > {GHELP_INFO_PATH}"
+        if self.resolve_command:
+            return f"{directive};\\\n    {self.resolve_command}"
+        return directive
+
+    def to_dockerfile_directive(self) -> str:
+        return f"{self.key} {self.to_shortened_dockerfile_directive()}"
+
+
+DockerfileComponent = Annotated[
+    AptGetItemList
+    | CopyItemList
+    | CurlItemList
+    | BashItemList
+    | EnvItemList
+    | ArgItemList
+    | InfoGenerator,
+    Field(discriminator="name"),
+]
 
 
 class Dockerfile(OpinionatedBaseModel):
     dockerfile_file: Path
     title: str = "gardener shell"
     from_image: str = "ghcr.io/gardenlinux/gardenlinux:latest"
-    components: list[
-        Annotated[
-            AptGetItemList
-            | CopyItemList
-            | CurlItemList
-            | BashItemList
-            | EnvItemList
-            | ArgItemList
-            | InfoGenerator,
-            Field(discriminator="name"),
-        ]
-    ]
+    components: list[DockerfileComponent]
 
-    def to_dockerfile(self, layers: list[DockerfileLayer]) -> str:
-        return f"FROM {self.from_image}\n{'\n'.join([str(l) for l in layers])}"
+    def to_dockerfile(self, layers: list[DockerfileLayer], stages: list[str] | None = None) -> str:
+        prefix = "".join(f"{stage}\n\n" for stage in stages or [])
+        return f"{prefix}FROM {self.from_image}\n{'\n'.join([str(l) for l in layers])}"
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Phase level profiling of the generator entry points.
+"""
+
+import cProfile
+import inspect
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Iterator
+
+from pydantic import BaseModel
+
+from generator import models
+
+# pstats key of a function: file, first line and name of its code
+CodeKey = tuple[str, int, str]
+
+
+def code_key(fn: Callable) -> CodeKey:
+    code = inspect.unwrap(getattr(fn, "__func__", fn)).__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def validator_functions(module: ModuleType) -> dict[CodeKey, str]:
+    """
+    The validators defined in a module by their pstats key: field and model validators of its
+    models, `validate` of its custom pydantic types and its functions named *_validator.
+    """
+    validators: dict[CodeKey, str] = {}
+    for obj in vars(module).values():
+        if getattr(obj, "__module__", None) != module.__name__:
+            continue
+        if isinstance(obj, type) and issubclass(obj, BaseModel):
+            decorators = obj.__pydantic_decorators__
+            for decorator in [
+                *decorators.field_validators.values(), *decorators.model_validators.values()
+            ]:
+                fn = getattr(decorator.func, "__func__", decorator.func)
+                validators[code_key(fn)] = fn.__qualname__
+        elif isinstance(obj, type) and "__get_pydantic_core_schema__" in vars(obj):
+            if callable(getattr(obj, "validate", None)):
+                validators[code_key(obj.validate)] = obj.validate.__qualname__
+        elif inspect.isfunction(obj) and obj.__name__.endswith("_validator"):
+            validators[code_key(obj)] = obj.__qualname__
+    return validators
+
+
+class Profiler:
+    SECTIONS = ("phases", "components", "validators")
+
+    def __init__(self, name: str, enabled: bool = False):
+        self.name = name
+        self.enabled = enabled
+        self.timings: dict[str, dict[str, list]] = {section: {} for section in self.SECTIONS}
+
+    def add(self, section: str, name: str, seconds: float) -> None:
+        entry = self.timings[section].setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.add("phases", name, time.perf_counter() - start)
+
+    def timed(self, section: str, name: str, fn: Callable, *args) -> Any:
+        if not self.enabled:
+            return fn(*args)
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.add(section, name, time.perf_counter() - start)
+
+    def add_validators(self, stats: cProfile.Profile, validators: dict[CodeKey, str]) -> None:
+        """Cumulative time and calls of the validators that ran while the stats were recorded"""
+        stats.create_stats()
+        for key, name in validators.items():
+            if key in stats.stats:  # type: ignore[attr-defined]
+                _, calls, _, seconds, _ = stats.stats[key]  # type: ignore[attr-defined]
+                self.timings["validators"][name] = [seconds, calls]
+
+    def report(self) -> str:
+        lines = [f"Profile of {self.name}:"]
+        rows = [
+            (section, name, seconds, calls)
+            for section in self.SECTIONS
+            for name, (seconds, calls) in self.timings[section].items()
+        ]
+        width = max((len(name) for _, name, _, _ in rows), default=0)
+        for section in self.SECTIONS:
+            entries = [row for row in rows if row[0] == section]
+            if not entries:
+                continue
+            lines.append(f"  {section}:")
+            for _, name, seconds, calls in entries:
+                lines.append(f"    {name:<{width}} {seconds:>9.4f}s {calls:>8} calls")
+        return "\n".join(lines)
+
+    @classmethod
+    @contextmanager
+    def run(
+        cls, name: str, started: float, enabled: bool, output: Path | None = None
+    ) -> Iterator["Profiler"]:
+        """
+        Profile an entry point whose settings were parsed since `started`.
+        The start-up (interpreter and imports) is estimated from the CPU time the process used
+        before the entry point, it misses the time spent waiting for I/O.
+        The run is recorded with cProfile to split the time by validator of the models, so the
+        phases include its overhead. With an output path the statistics are dumped as pstats.
+        """
+        profiler = cls(name, enabled or output is not None)
+        if not profiler.enabled:
+            yield profiler
+            return
+
+        startup = max(time.process_time() - (time.perf_counter() - started), 0.0)
+        profiler.add("phases", "start-up (CPU time estimate)", startup)
+        profiler.add("phases", "settings", time.perf_counter() - started)
+        stats = cProfile.Profile()
+        stats.enable()
+        try:
+            yield profiler
+        finally:
+            stats.disable()
+            profiler.add_validators(stats, validator_functions(models))
+            print(profiler.report())
+            if output is not None:
+                stats.dump_stats(output)
+                print(f"cProfile statistics written to {output}")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Snapshots of validated components that can be restored without running validation again.
+"""
+
+import functools
+import inspect
+import types
+from pathlib import Path
+from typing import Annotated, Any, Callable, Literal, Union, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError
+
+import generator.models as m
+from generator.incremental import copy_sources, fingerprint_bytes, fingerprint_path
+
+# Changes to the models invalidate every snapshot, validators included
+SCHEMA_VERSION = fingerprint_bytes(Path(m.__file__).read_bytes())
+
+
+def discriminator(model: type[BaseModel]) -> Any:
+    field = model.model_fields.get("name")
+    if field is not None and get_origin(field.annotation) is Literal:
+        return get_args(field.annotation)[0]
+    return None
+
+
+def _is_model(annotation: Any) -> bool:
+    return inspect.isclass(annotation) and issubclass(annotation, BaseModel)
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def builder(annotation: Any) -> Callable[[Any], Any]:
+    """
+    Function that rebuilds a value of the given type from its JSON dump without validation.
+    The type is inspected once, builders of models are cached.
+    """
+    origin = get_origin(annotation)
+    if origin is Annotated:
+        return builder(get_args(annotation)[0])
+    if origin in (Union, types.UnionType):
+        return _union_builder(get_args(annotation))
+    if origin is list:
+        item = builder(get_args(annotation)[0])
+        if item is _identity:
+            return list
+        return lambda value: [item(v) for v in value]
+    if _is_model(annotation):
+        return _model_builder(annotation)
+    if inspect.isclass(annotation) and issubclass(annotation, Path):
+        return lambda value: None if value is None else Path(value)
+    return _identity
+
+
+@functools.cache
+def _model_builder(model: type[BaseModel]) -> Callable[[Any], Any]:
+    fields: dict[str, Callable[[Any], Any]] = {}
+
+    def build(value: dict) -> BaseModel:
+        if not fields:
+            fields.update({name: builder(f.annotation) for name, f in model.model_fields.items()})
+        return model.model_construct(**{name: fields[name](v) for name, v in value.items()})
+
+    return build
+
+
+def _union_builder(members: tuple) -> Callable[[Any], Any]:
+    unwrapped = [get_args(a)[0] if get_origin(a) is Annotated else a for a in members]
+    models = [a for a in unwrapped if _is_model(a)]
+    by_name = {discriminator(a): _model_builder(a) for a in models}
+    lists = [builder(a) for a in unwrapped if get_origin(a) is list]
+    scalars = [
+        builder(a) for a in unwrapped
+        if a is not type(None) and get_origin(a) is not list and not _is_model(a)
+    ]
+
+    def build(value: Any) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            return by_name.get(value.get("name"), _model_builder(models[0]))(value)
+        if isinstance(value, list):
+            return lists[0](value)
+        return scalars[0](value) if scalars else value
+
+    return build
+
+
+class Snapshot(m.OpinionatedBaseModel):
+    schema_version: str
+    config: str
+    sources: dict[str, str] = {}
+    components: list[dict[str, Any]]
+
+    @classmethod
+    def build(cls, config: bytes, raw_components: Any, components: list) -> "Snapshot":
+        return cls(
+            schema_version=SCHEMA_VERSION,
+            config=fingerprint_bytes(config),
+            sources={src: fingerprint_path(Path(src)) for src in copy_sources(raw_components)},
+            components=[c.model_dump(mode="json") for c in components],
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "Snapshot | None":
+        """Load a snapshot, an unreadable one is treated as missing"""
+        try:
+            return cls.model_validate_json(path.read_bytes())
+        except (OSError, ValidationError):
+            return None
+
+    def save(self, path: Path) -> None:
+        path.write_text(self.model_dump_json(), encoding="utf-8")
+
+    def matches(self, config: bytes) -> bool:
+        """The snapshot was taken from the same config, models and copy sources"""
+        if self.schema_version != SCHEMA_VERSION or self.config != fingerprint_bytes(config):
+            return False
+        return all(fingerprint_path(Path(src)) == digest for src, digest in self.sources.items())
+
+    def restore(self) -> list:
+        build = builder(m.DockerfileComponent)
+        return [build(c) for c in self.components]
@@ -4,12 +4,15 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+from typing import Collection
+
 import generator.models as m
 
 Components = (
     m.AptGetItemList
     | m.CopyItemList
     | m.CurlItemList
+    | m.CurlStageCopyList
     | m.BashItemList
     | m.EnvItemList
     | m.ArgItemList
@@ -79,3 +82,178 @@ def directives_to_layers(
     directives: ComponentsList,
 ) -> list[m.DockerfileLayer]:
     return grouped_components_to_dockerfile_layers(group_components_by_key(directives))
+
+
+def component_volatility(drv: Components) -> int:
+    """Number of items that declare a version and are therefore bumped regularly"""
+    return sum(1 for item in getattr(drv, "items", []) if getattr(item, "version", ""))
+
+
+def component_names(drv: Components) -> set[str]:
+    """Names by which ordering constraints refer to a component, its own and its items' names"""
+    items = getattr(drv, "items", [])
+    return {drv.name, *(item.name for item in items if isinstance(item, m.BaseItem))}
+
+
+def ordering_constraints(directives: ComponentsList) -> set[tuple[int, int]]:
+    """
+    Pairs of positions (earlier, later) required by the `after` and `before` lists of the
+    components. Unknown names and a given order that breaks a constraint are rejected.
+    """
+    names = [component_names(drv) for drv in directives]
+    constraints: set[tuple[int, int]] = set()
+    for idx, drv in enumerate(directives):
+        for refs, after in ((getattr(drv, "after", []), True), (getattr(drv, "before", []), False)):
+            for ref in refs:
+                matches = [
+                    other for other, known in enumerate(names) if ref in known and other != idx
+                ]
+                if not matches:
+                    raise ValueError(f"{drv.name} is ordered relative to an unknown name: {ref}")
+                constraints.update((other, idx) if after else (idx, other) for other in matches)
+    broken = sorted((earlier, later) for earlier, later in constraints if earlier > later)
+    if broken:
+        pairs = ", ".join(
+            f"{directives[earlier].name} before {directives[later].name}"
+            for earlier, later in broken
+        )
+        raise ValueError(f"The components break their ordering constraints: {pairs}")
+    return constraints
+
+
+def plan_components(directives: ComponentsList) -> ComponentsList:
+    """
+    Move reorderable components towards the end of the Dockerfile, least volatile first,
+    so that version bumps invalidate as few cached layers as possible.
+    A reorderable component stays in place if a component that is not moved has to follow it.
+    All other components keep their relative order and the InfoGenerator stays last.
+    """
+    constraints = ordering_constraints(directives)
+    info = {idx for idx, drv in enumerate(directives) if isinstance(drv, m.InfoGenerator)}
+    movable = {
+        idx for idx, drv in enumerate(directives)
+        if idx not in info and getattr(drv, "reorderable", False)
+    }
+    # Moving a component behind one that has to follow it would break the constraint
+    while True:
+        blocked = {
+            earlier for earlier, later in constraints
+            if earlier in movable and later not in movable and later not in info
+        }
+        if not blocked:
+            break
+        movable -= blocked
+
+    # Among each other the moved components follow their constraints, least volatile first
+    moved: list[int] = []
+    pending = set(movable)
+    while pending:
+        ready = [
+            idx for idx in pending
+            if not any(later == idx and earlier in pending for earlier, later in constraints)
+        ]
+        nxt = min(ready, key=lambda idx: (component_volatility(directives[idx]), idx))
+        moved.append(nxt)
+        pending.remove(nxt)
+
+    fixed = [idx for idx in range(len(directives)) if idx not in movable and idx not in info]
+    return [directives[idx] for idx in [*fixed, *moved, *sorted(info)]]
+
+
+def layer_invalidation_estimate(directives: ComponentsList) -> dict[str, int]:
+    """
+    Number of layers that are rebuilt when a component of the given kind changes,
+    or when a versioned item is bumped. The earliest occurrence of a kind wins.
+    """
+    grouped = group_components_by_key(directives)
+    estimate: dict[str, int] = {}
+    for idx, group in enumerate(grouped):
+        invalidated = len(grouped) - idx
+        for drv in (drv for components in group.values() for drv in components):
+            if isinstance(drv, m.InfoGenerator):
+                continue
+            estimate.setdefault(drv.name, invalidated)
+            for item in getattr(drv, "items", []):
+                if getattr(item, "version", ""):
+                    estimate.setdefault(f"{item.name} version bump", invalidated)
+    return estimate
+
+
+def format_layer_plan(before: ComponentsList, after: ComponentsList) -> str:
+    previous = layer_invalidation_estimate(before)
+    planned = layer_invalidation_estimate(after)
+    lines = ["Layers invalidated per change (before -> after planning):"]
+    width = max((len(kind) for kind in planned), default=0)
+    for kind, layers in planned.items():
+        lines.append(f"  {kind:<{width}}  {previous.get(kind, layers)} -> {layers}")
+    return "\n".join(lines)
+
+
+def split_download_stages(
+    directives: ComponentsList, from_image: str
+) -> tuple[list[str], ComponentsList]:
+    """
+    Turn every curl item into its own build stage, so that BuildKit downloads them concurrently
+    and caches them separately. The curl components are replaced by COPY --from directives.
+    """
+    names = [item.stage_name for drv in directives if isinstance(drv, m.CurlItemList) for item in drv.items]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Curl items with the same download stage name: {', '.join(duplicates)}")
+
+    stages: list[str] = []
+    args: list[str] = []
+    result: ComponentsList = []
+    for drv in directives:
+        if isinstance(drv, m.ArgItemList):
+            args.extend(drv.items)
+        if isinstance(drv, m.CurlItemList):
+            stages.extend(drv.to_download_stages(from_image, args))
+            drv = m.CurlStageCopyList(items=drv.items)
+        result.append(drv)
+    return stages, result
+
+
+def bake_on_demand_tools(
+    directives: ComponentsList, variant: str | None, bake: Collection[str] = ()
+) -> ComponentsList:
+    """
+    Install the selected on-demand tools while building the image, each in its own RUN layer in
+    front of the InfoGenerator, so that baking a tool or changing its version rebuilds only that layer.
+    Tools are selected by their `bake` and `bake_variants` settings or by binary name in `bake`.
+    """
+    items = [
+        item
+        for drv in directives if isinstance(drv, m.CopyItemList)
+        for item in drv.items if item.on_demand is not None
+    ]
+    unknown = set(bake) - {item.on_demand.binary for item in items if item.on_demand is not None}
+    if unknown:
+        raise ValueError(f"Unknown on-demand tools to bake: {', '.join(sorted(unknown))}")
+    # Baked layers are only reproducible with a pinned version, not the latest release
+    unpinned = set(bake) & {
+        item.on_demand.binary
+        for item in items if item.on_demand is not None and not item.on_demand.version
+    }
+    if unpinned:
+        raise ValueError(
+            f"On-demand tools to bake without a pinned version: {', '.join(sorted(unpinned))}"
+        )
+
+    layers: ComponentsList = [
+        m.BashItemList(
+            name="bash",
+            items=[m.BashItem(name=item.on_demand.binary, command=item.bake_command())],
+            can_be_combined=False,
+        )
+        for item in items
+        if item.on_demand is not None and item.on_demand.baked(variant, bake)
+    ]
+    position = next(
+        (idx for idx, drv in enumerate(directives) if isinstance(drv, m.InfoGenerator)), len(directives)
+    )
+    rest = directives[position:]
+    if layers and rest:
+        # Keep the ghelp info out of the last install layer
+        rest = [rest[0].model_copy(update={"can_be_combined": False}), *rest[1:]]
+    return directives[:position] + layers + rest
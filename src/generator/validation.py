@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Rendering of validation Dockerfiles.
+"""
+
+import json
+from pathlib import Path, PurePosixPath
+from statistics import median
+
+from generator import validation_runner
+from generator.models import OpinionatedBaseModel
+
+RUNNER_DIR = PurePosixPath("/var/lib/validation")
+RUNNER_SHELL = ["/bin/bash", "-lic"]
+RUNNER_STAGE = "checks"
+
+
+class ValidationCheck(OpinionatedBaseModel):
+    name: str
+    command: str
+    fingerprint: str = ""
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.name, self.command
+
+
+class CachedCheck(ValidationCheck):
+    """A check left out because it passed in the previous report"""
+    duration: float = 0.0
+
+
+class RunnerPlan(OpinionatedBaseModel):
+    """Input of validation_runner.py inside the validation image"""
+    workers: int
+    timeout: float
+    shell: list[str] = RUNNER_SHELL
+    report: str = str(RUNNER_DIR / "report.json")
+    junit: str = str(RUNNER_DIR / "report.xml")
+    checks: list[ValidationCheck]
+    cached: list[CachedCheck] = []
+
+
+def serial_validation_lines(checks: list[ValidationCheck]) -> list[str]:
+    """One RUN directive per check"""
+    lines = []
+    for check in checks:
+        lines.append(f"# Validate: {check.name}")
+        lines.append(f"RUN {check.command}")
+    return lines
+
+
+def write_runner_files(plan: RunnerPlan, dockerfile: Path) -> tuple[Path, Path]:
+    """Write the runner plan and script next to the validation Dockerfile"""
+    plan_file = dockerfile.with_name(f"{dockerfile.stem}.runner.json")
+    plan_file.write_text(plan.model_dump_json(indent=2), encoding="utf-8")
+    runner_file = dockerfile.with_name("validation_runner.py")
+    runner_file.write_text(Path(validation_runner.__file__).read_text(encoding="utf-8"), encoding="utf-8")
+    return plan_file, runner_file
+
+
+def runner_validation_lines(plan_file: Path, runner_file: Path, build_context: Path) -> list[str]:
+    """
+    A single RUN directive that executes all checks through the runner in the `checks` stage.
+    The runner does not fail that stage, so that the reports can be exported from the `report`
+    stage; the final stage fails the build if a check failed.
+    """
+    plan_source = plan_file.resolve().relative_to(build_context.resolve()).as_posix()
+    runner_source = runner_file.resolve().relative_to(build_context.resolve()).as_posix()
+    runner = RUNNER_DIR / "validation_runner.py"
+    return [
+        f"COPY {plan_source} {RUNNER_DIR / 'plan.json'}",
+        f"COPY {runner_source} {runner}",
+        "# Validate: all checks in parallel",
+        f"RUN python3 {runner} {RUNNER_DIR / 'plan.json'}",
+        "",
+        "FROM scratch AS report",
+        f"COPY --from={RUNNER_STAGE} {RUNNER_DIR / 'report.json'} {RUNNER_DIR / 'report.xml'} /",
+        "",
+        f"FROM {RUNNER_STAGE}",
+        f"RUN python3 {runner} --verify {RUNNER_DIR / 'report.json'}",
+    ]
+
+
+def load_durations(report: Path) -> dict[tuple[str, str], float]:
+    """Per-check durations from a report written by validation_runner.py"""
+    with open(report, encoding="utf-8") as f:
+        checks = json.load(f).get("checks", [])
+    return {(c["name"], c["command"]): float(c["duration"]) for c in checks if "duration" in c}
+
+
+def load_passed_fingerprints(report: Path) -> set[str]:
+    """Fingerprints of the checks that passed, or were cached, in a report written by validation_runner.py"""
+    with open(report, encoding="utf-8") as f:
+        checks = json.load(f).get("checks", [])
+    return {
+        c["fingerprint"] for c in checks if c.get("fingerprint") and c.get("status") in ("passed", "cached")
+    }
+
+
+def skip_passed_checks(
+    checks: list[ValidationCheck], passed: set[str]
+) -> tuple[list[ValidationCheck], list[ValidationCheck]]:
+    """Split checks into those that need to run and those with a cached pass"""
+    remaining = [c for c in checks if c.fingerprint not in passed]
+    cached = [c for c in checks if c.fingerprint in passed]
+    return remaining, cached
+
+
+def shard_checks(
+    checks: list[ValidationCheck],
+    shards: int,
+    index: int,
+    durations: dict[tuple[str, str], float] | None = None,
+) -> tuple[list[ValidationCheck], float]:
+    """
+    Split checks into shards of similar total duration and return the requested shard
+    together with its estimated duration.
+    Checks are assigned longest first to the least loaded shard; checks without a recorded
+    duration are assumed to take the median of the known durations.
+    """
+    durations = durations or {}
+    known = [durations[c.key] for c in checks if c.key in durations]
+    default = median(known) if known else 1.0
+    cost = [durations.get(c.key, default) for c in checks]
+
+    loads = [0.0] * shards
+    assigned: list[list[int]] = [[] for _ in range(shards)]
+    for idx in sorted(range(len(checks)), key=lambda i: (-cost[i], i)):
+        target = min(range(shards), key=lambda s: (loads[s], s))
+        loads[target] += cost[idx]
+        assigned[target].append(idx)
+    return [checks[i] for i in sorted(assigned[index])], loads[index]
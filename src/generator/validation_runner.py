@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Runs the validation commands of an image concurrently inside a single RUN directive.
+
+This file is copied into the validation image and executed there with the image's python3,
+so it must only use modules that ship with python3-minimal.
+
+The report is written even if checks fail and the runner exits 0, so that the build step
+that runs it succeeds; a later step fails the build with --verify.
+
+Usage: validation_runner.py <plan.json> | --verify <report.json>
+"""
+
+import json
+import os
+import signal
+import subprocess  # nosec B404
+import sys
+import threading
+import time
+
+MAX_OUTPUT = 4000
+
+
+def run_check(check: dict, shell: list[str], timeout: float) -> dict:
+    start = time.monotonic()
+    proc = subprocess.Popen(  # nosec B603
+        shell + [check["command"]],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    try:
+        output, _ = proc.communicate(timeout=timeout)
+        status = "passed" if proc.returncode == 0 else "failed"
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        output, _ = proc.communicate()
+        status = "timeout"
+    return {
+        **check,
+        "status": status,
+        "returncode": proc.returncode,
+        "duration": round(time.monotonic() - start, 3),
+        "output": output.decode("utf-8", errors="replace")[-MAX_OUTPUT:],
+    }
+
+
+def run_checks(checks: list[dict], workers: int, timeout: float, shell: list[str]) -> list[dict]:
+    """Run all checks with a bounded number of worker threads, keeping the input order"""
+    results: list[dict] = [{}] * len(checks)
+    pending = iter(range(len(checks)))
+    lock = threading.Lock()
+
+    def worker() -> None:
+        while True:
+            with lock:
+                idx = next(pending, None)
+            if idx is None:
+                return
+            result = run_check(checks[idx], shell, timeout)
+            results[idx] = result
+            print(f"{result['status'].upper():<8}{result['name']} ({result['duration']}s)", flush=True)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(workers, len(checks))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results: list[dict], duration: float) -> dict:
+    passed = sum(1 for r in results if r["status"] == "passed")
+    cached = sum(1 for r in results if r["status"] == "cached")
+    return {
+        "total": len(results),
+        "passed": passed,
+        "cached": cached,
+        "failed": len(results) - passed - cached,
+        "duration": round(duration, 3),
+    }
+
+
+def xml_escape(value: str) -> str:
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+    )
+
+
+def to_junit(results: list[dict], summary: dict) -> str:
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<testsuite name="image-validation" tests="{summary["total"]}" '
+        f'failures="{summary["failed"]}" time="{summary["duration"]}">',
+    ]
+    for r in results:
+        lines.append(f'  <testcase name="{xml_escape(r["name"])}" time="{r["duration"]}">')
+        if r["status"] == "cached":
+            lines.append('    <skipped message="passed with an unchanged definition"/>')
+        elif r["status"] != "passed":
+            lines.append(
+                f'    <failure message="{r["status"]}: {xml_escape(r["command"])}">'
+                f'{xml_escape(r["output"])}</failure>'
+            )
+        lines.append("  </testcase>")
+    lines.append("</testsuite>")
+    return "\n".join(lines) + "\n"
+
+
+def verify(report: str) -> int:
+    """Exit status of a report written by a previous run"""
+    with open(report, encoding="utf-8") as f:
+        summary = json.load(f)["summary"]
+    if summary["failed"]:
+        print(f"{summary['failed']} of {summary['total']} checks failed, see {report}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> int:
+    if len(sys.argv) == 3 and sys.argv[1] == "--verify":
+        return verify(sys.argv[2])
+    if len(sys.argv) != 2:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        return 2
+    with open(sys.argv[1], encoding="utf-8") as f:
+        plan = json.load(f)
+
+    start = time.monotonic()
+    results = run_checks(plan["checks"], plan["workers"], plan["timeout"], plan["shell"])
+    results += [{**check, "status": "cached"} for check in plan.get("cached", [])]
+    summary = summarize(results, time.monotonic() - start)
+
+    with open(plan["report"], "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "checks": results}, f, indent=2)
+    if plan.get("junit"):
+        with open(plan["junit"], "w", encoding="utf-8") as f:
+            f.write(to_junit(results, summary))
+
+    for r in results:
+        if r["status"] not in ("passed", "cached"):
+            print(f"\n--- {r['name']} {r['status']}: {r['command']}\n{r['output']}")
+    cached = f", {summary['cached']} cached" if summary["cached"] else ""
+    print(f"\n{summary['passed']}/{summary['total']} checks passed{cached} in {summary['duration']}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from pathlib import Path
+
+import pytest
+
+from generator import benchmark as b
+from generator.models import Dockerfile
+
+
+@pytest.mark.parametrize("items", [1, 6, 13, 250])
+def test_synthetic_components(items):
+    raw = b.synthetic_components(items, 10, Path(__file__))
+    assert sum(len(c["items"]) for c in raw) == items
+    assert raw[-1]["name"] == "bash"
+    assert all(len(c["items"]) <= 10 for c in raw)
+    Dockerfile(dockerfile_file=Path("/dev/null"), components=raw)
+
+
+def test_synthetic_components_cover_all_list_types():
+    raw = b.synthetic_components(12, 1, Path(__file__))
+    assert {c["name"] for c in raw} == set(b.LIST_TYPES)
+
+
+def test_benchmark_size():
+    result = b.benchmark_size(30, 5, 2, Path(__file__))
+    assert result.items == 30
+    assert result.components == 6
+    assert list(result.phases) == b.PHASES
+    assert all(p.seconds >= 0 and p.peak_bytes >= 0 for p in result.phases.values())
+    assert result.dockerfile_bytes > 0
+
+
+def test_compare_reports():
+    def report(seconds: float, peak: int, items: int = 10) -> b.BenchmarkReport:
+        phases = {p: b.PhaseResult(seconds=seconds, peak_bytes=peak) for p in b.PHASES}
+        return b.BenchmarkReport(
+            repeat=1,
+            results=[b.SizeResult(items=items, components=1, dockerfile_bytes=1, phases=phases)],
+        )
+
+    lines = b.compare_reports(report(1.0, 100), report(2.0, 50)).splitlines()
+    assert len(lines) == 1 + len(b.PHASES)
+    assert lines[1].split() == ["10", "yaml_load", "2.00x", "0.50x"]
+
+    assert b.compare_reports(report(1.0, 100, items=20), report(2.0, 50)).splitlines() == lines[:1]
+
+    restored = b.BenchmarkReport.model_validate_json(report(1.0, 1).model_dump_json())
+    assert restored == report(1.0, 1)
@@ -0,0 +1,212 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import sys
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from pathlib import Path
+
+import pytest
+
+GHELP = Path(__file__).resolve().parent.parent / "hacks" / "ghelp"
+
+
+@pytest.fixture
+def ghelp(tmp_path, monkeypatch):
+    """hacks/ghelp as a module, with the dpkg status, install directories and cache in tmp_path"""
+    loader = SourceFileLoader("ghelp", str(GHELP))
+    module = module_from_spec(spec_from_loader("ghelp", loader))
+    loader.exec_module(module)
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "status").write_text("")
+    monkeypatch.setattr(module, "DPKG_STATUS", str(tmp_path / "status"))
+    monkeypatch.setattr(module, "ON_DEMAND_BIN_DIRS", (str(tmp_path / "bin"),))
+    monkeypatch.setattr(module, "site_packages_dirs", lambda: [])
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return module
+
+
+def write_ghelp_info(path: Path) -> Path:
+    path.write_text(json.dumps({
+        "apt": [["jq", "jq"], ["curl", "curl"]],
+        "pip": [],
+        "downloaded": [["kubectl", "v1.34.10", "command line tool for controlling Kubernetes clusters."]],
+        "index": {
+            "jq": [["apt", "jq"]],
+            "curl": [["apt", "curl"]],
+            "kubectl": [["downloaded", "kubectl"]],
+            "kubernetes": [["downloaded", "kubectl"]],
+        },
+        "resolved": {
+            "apt": [["jq", "1.7.1-3", "lightweight JSON processor"], ["curl", "8.5.0-2", "URL transfer tool"]],
+            "pip": [],
+        },
+        "on_demand": [],
+        "hacks": [],
+    }))
+    return path
+
+
+def run_ghelp(ghelp, monkeypatch, capsys, info_file: Path, *args: str) -> list[dict]:
+    monkeypatch.setattr(sys, "argv", ["ghelp", "--json", "--info-file", str(info_file), *args])
+    ghelp.main()
+    return json.loads(capsys.readouterr().out)
+
+
+def test_cache_key_invalidation(ghelp, tmp_path, subtests):
+    info_file = write_ghelp_info(tmp_path / "ghelp_info")
+    os.utime(tmp_path / "bin", ns=(10**9, 10**9))
+    key = ghelp.cache_key(str(info_file))
+    assert ghelp.cache_key(str(info_file)) == key
+
+    with subtests.test("Package installs change the dpkg status"):
+        os.utime(tmp_path / "status", ns=(2 * 10**9, 2 * 10**9))
+        assert ghelp.cache_key(str(info_file)) != key
+        key = ghelp.cache_key(str(info_file))
+
+    with subtests.test("On-demand installs add a binary to an install directory"):
+        (tmp_path / "bin" / "k9s").write_text("")
+        assert ghelp.cache_key(str(info_file)) != key
+        key = ghelp.cache_key(str(info_file))
+
+    with subtests.test("A new ghelp info"):
+        write_ghelp_info(info_file)
+        os.utime(info_file, ns=(3 * 10**9, 3 * 10**9))
+        assert ghelp.cache_key(str(info_file)) != key
+
+
+def test_cache_hit_skips_ghelp_info(ghelp, tmp_path, monkeypatch, capsys):
+    info_file = write_ghelp_info(tmp_path / "ghelp_info")
+    os.utime(tmp_path / "bin", ns=(10**9, 10**9))
+    listed = run_ghelp(ghelp, monkeypatch, capsys, info_file)
+    queried = run_ghelp(ghelp, monkeypatch, capsys, info_file, "kube")
+    assert [row["name"] for row in queried] == ["kubectl"]
+
+    def fail(path: str) -> dict:
+        raise AssertionError(f"{path} loaded on a cache hit")
+
+    monkeypatch.setattr(ghelp, "load_ghelp_info", fail)
+    assert run_ghelp(ghelp, monkeypatch, capsys, info_file) == listed
+    assert run_ghelp(ghelp, monkeypatch, capsys, info_file, "kube") == queried
+
+    (tmp_path / "bin" / "k9s").write_text("")
+    with pytest.raises(AssertionError, match="loaded on a cache hit"):
+        run_ghelp(ghelp, monkeypatch, capsys, info_file)
+
+
+DPKG_STATUS = """\
+Package: jq
+Status: install ok installed
+Version: 1.7.1-3
+Description: lightweight and flexible command-line JSON processor
+ jq is like sed for JSON data.
+
+Package: removed
+Status: deinstall ok config-files
+Version: 1.0
+Description: removed package
+
+Package: curl
+Status: install ok installed
+Priority: optional
+Version: 8.5.0-2
+Description: command line tool for transferring data with URL syntax
+
+Package: jq
+Status: install ok installed
+Version: 0.0-duplicate
+Description: second paragraph of the same package
+"""
+
+
+def test_index_dpkg_status(ghelp, tmp_path):
+    status = tmp_path / "status"
+    status.write_text(DPKG_STATUS)
+    assert ghelp.index_dpkg_status(str(status)) == {
+        "jq": ("1.7.1-3", "lightweight and flexible command-line JSON processor"),
+        "curl": ("8.5.0-2", "command line tool for transferring data with URL syntax"),
+    }
+    status.write_text("")
+    assert ghelp.index_dpkg_status(str(status)) == {}
+
+
+def test_ghelp_tokens(ghelp):
+    assert ghelp.ghelp_tokens("kube-proxy 1.2\\nNotes on IPv6") == {
+        "kube-proxy", "kube", "proxy", "1.2", "notes", "on", "ipv6",
+    }
+    assert ghelp.ghelp_tokens("a b") == set()
+
+
+def test_select_tools(ghelp, tmp_path):
+    ghelp_info = json.loads(write_ghelp_info(tmp_path / "ghelp_info").read_text())
+    assert ghelp.select_tools(ghelp_info, ["kube"]) == {("downloaded", "kubectl")}
+    assert ghelp.select_tools(ghelp_info, ["KUBE", "kubectl"]) == {("downloaded", "kubectl")}
+    assert ghelp.select_tools(ghelp_info, ["kube", "jq"]) == set()
+    assert ghelp.select_tools(ghelp_info, ["unknown"]) == set()
+
+
+def test_restrict_sections(ghelp):
+    sections = {
+        "apt": [["jq", "1.7.1-3", "JSON processor"], ["curl", "8.5.0-2", "URL tool"]],
+        "hacks": [["ops-pod", "", "Start an ops pod on a node"], ["ghelp", "", "Show the tools"]],
+    }
+    assert ghelp.restrict_sections(sections, {("apt", "jq"), ("hacks", "ghelp")}, ["po"]) == {
+        "apt": [["jq", "1.7.1-3", "JSON processor"]],
+        # The hacks are matched against the terms, not the index
+        "hacks": [["ops-pod", "", "Start an ops pod on a node"]],
+    }
+
+
+def test_parse_args(ghelp, subtests):
+    with subtests.test("Plain flags and terms"):
+        args = ghelp.parse_args(["--json", "kube", "--no-cache", "proxy"])
+        assert isinstance(args, ghelp.Arguments)
+        assert (args.json, args.no_cache, args.grid, args.terms) == (True, True, False, ["kube", "proxy"])
+
+    with subtests.test("Options with values fall back to argparse"):
+        args = ghelp.parse_args(["--info-file", "/tmp/info", "--json", "kube"])
+        assert not isinstance(args, ghelp.Arguments)
+        assert (args.info_file, args.json, args.terms) == ("/tmp/info", True, ["kube"])
+
+    with subtests.test("Unknown options are reported by argparse"):
+        with pytest.raises(SystemExit) as exc:
+            ghelp.parse_args(["--unknown"])
+        assert exc.value.code == 2
+
+
+def test_no_match(ghelp, tmp_path, monkeypatch, capsys):
+    info_file = write_ghelp_info(tmp_path / "ghelp_info")
+    monkeypatch.setattr(sys, "argv", ["ghelp", "--no-pager", "--info-file", str(info_file), "nothing"])
+    with pytest.raises(SystemExit) as exc:
+        ghelp.main()
+    assert exc.value.code == 1
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert err == "No tools match nothing\n"
+
+    assert run_ghelp(ghelp, monkeypatch, capsys, info_file, "nothing") == []
+
+
+def test_output_format(ghelp, tmp_path, monkeypatch, capsys, subtests):
+    info_file = write_ghelp_info(tmp_path / "ghelp_info")
+
+    def run(*args: str, tty: bool) -> str:
+        monkeypatch.setattr(sys.stdout, "isatty", lambda: tty)
+        monkeypatch.setattr(sys, "argv", ["ghelp", "--no-pager", "--info-file", str(info_file), *args])
+        ghelp.main()
+        return capsys.readouterr().out
+
+    with subtests.test("Streamed on a terminal without importing tabulate"):
+        with monkeypatch.context() as m:
+            m.setitem(sys.modules, "tabulate", None)
+            assert run(tty=True).startswith("TOOL/PACKAGE")
+    with subtests.test("Streamed when the output is not a terminal"):
+        assert run(tty=False).startswith("TOOL/PACKAGE")
+    with subtests.test("Grid table on request"):
+        assert run("--grid", tty=True).startswith("+---")
+        assert run("--grid", tty=False).startswith("+---")
@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from generator import incremental as inc
+
+
+def test_fingerprint_json_is_order_independent():
+    assert inc.fingerprint_json({"a": 1, "b": [1, 2]}) == inc.fingerprint_json({"b": [1, 2], "a": 1})
+    assert inc.fingerprint_json({"a": 1}) != inc.fingerprint_json({"a": 2})
+
+
+def test_fingerprint_path(tmp_path):
+    assert inc.fingerprint_path(tmp_path / "missing") == "missing"
+
+    tree = tmp_path / "tree"
+    (tree / "sub").mkdir(parents=True)
+    script = tree / "sub" / "script"
+    script.write_text("echo hi")
+    before = inc.fingerprint_path(tree)
+    assert inc.fingerprint_path(tree) == before
+
+    script.chmod(0o755)
+    after_chmod = inc.fingerprint_path(tree)
+    assert after_chmod != before
+
+    script.write_text("echo bye")
+    assert inc.fingerprint_path(tree) != after_chmod
+
+
+def test_copy_sources():
+    components = [
+        {"name": "bash", "items": ["echo"]},
+        {"name": "copy", "items": [{"name": "a", "from": "./a", "to": "/a"}, {"name": "b", "from": "./b", "to": "/b"}]},
+    ]
+    assert inc.copy_sources(components) == ["./a", "./b"]
+    assert inc.copy_sources(None) == []
+
+
+def test_manifest_is_fresh(tmp_path, subtests):
+    source = tmp_path / "source"
+    source.write_text("content")
+    config = b"config"
+    components = [{"name": "copy", "items": [{"name": "s", "from": str(source), "to": "/s"}]}]
+    output = tmp_path / "out"
+    output.write_text("generated")
+    written = tmp_path / "written"
+    written.write_text("also generated")
+
+    manifest = inc.Manifest()
+    manifest.entries["key"] = inc.ManifestEntry.build(
+        config, components, "settings", inc.fingerprint_bytes(b"generated"), [written]
+    )
+    manifest.save(tmp_path / "manifest.json")
+    manifest = inc.Manifest.load(tmp_path / "manifest.json")
+
+    with subtests.test("Unchanged"):
+        assert manifest.is_fresh("key", config, "settings", output)
+    with subtests.test("Unknown key"):
+        assert not manifest.is_fresh("other", config, "settings", output)
+    with subtests.test("Changed config"):
+        assert not manifest.is_fresh("key", b"changed", "settings", output)
+    with subtests.test("Changed settings"):
+        assert not manifest.is_fresh("key", config, "other settings", output)
+    with subtests.test("Changed output"):
+        output.write_text("edited by hand")
+        assert not manifest.is_fresh("key", config, "settings", output)
+        output.write_text("generated")
+    with subtests.test("Changed other file"):
+        written.unlink()
+        assert not manifest.is_fresh("key", config, "settings", output)
+        written.write_text("also generated")
+        assert manifest.is_fresh("key", config, "settings", output)
+    with subtests.test("Changed copy source"):
+        source.write_text("new content")
+        assert not manifest.is_fresh("key", config, "settings", output)
+
+
+def test_manifest_load_invalid(tmp_path):
+    assert inc.Manifest.load(tmp_path / "missing.json") == inc.Manifest()
+    (tmp_path / "broken.json").write_text("{not json")
+    assert inc.Manifest.load(tmp_path / "broken.json") == inc.Manifest()
+
+
+def test_manifest_changed_components():
+    manifest = inc.Manifest()
+    first = inc.ManifestEntry.build(b"", [{"name": "a"}, {"name": "b"}], "")
+    assert manifest.changed_components("key", first) == [0, 1]
+
+    manifest.entries["key"] = first
+    second = inc.ManifestEntry.build(b"", [{"name": "a"}, {"name": "c"}, {"name": "d"}], "")
+    assert manifest.changed_components("key", second) == [1, 2]
@@ -0,0 +1,245 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+INSTALL_LIB = Path(__file__).resolve().parent.parent / "hacks" / "install-lib"
+
+pytestmark = pytest.mark.skipif(
+    any(shutil.which(tool) is None for tool in ("bash", "curl", "jq", "sha256sum", "tar")),
+    reason="needs bash, curl, jq, sha256sum and tar",
+)
+
+
+class ReleaseServer(ThreadingHTTPServer):
+    """Stand-in for GitHub that serves byte ranges and can fail or cut off responses"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ReleaseHandler)
+        self.files: dict[str, bytes] = {}
+        self.failures: dict[str, int] = {}
+        self.truncate: dict[str, int] = {}
+        self.requests: list[tuple[str, str | None]] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class ReleaseHandler(BaseHTTPRequestHandler):
+    server: ReleaseServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("Range")))
+        if self.server.failures.get(self.path, 0) > 0:
+            self.server.failures[self.path] -= 1
+            self.send_error(503)
+            return
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].removeprefix("bytes=").split("-")[0])
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+        else:
+            self.send_response(200)
+        body = content[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.server.truncate.get(self.path, 0) > 0:
+            # Cut the connection after half of the body, like a dropped transfer
+            self.server.truncate[self.path] -= 1
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    srv = ReleaseServer()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def release_archive(member: str, content: bytes) -> bytes:
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz") as tar:
+        info = tarfile.TarInfo(member)
+        info.size = len(content)
+        info.mode = 0o755
+        tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+def run_lib(script: str, server: ReleaseServer, tmp_path: Path, **env: str) -> subprocess.CompletedProcess:
+    environment = {k: v for k, v in os.environ.items() if k != "OPS_TOOLBELT_CACHE_DIR"}
+    environment.update({
+        "HOME": str(tmp_path / "home"),
+        "XDG_CACHE_HOME": str(tmp_path / "xdg"),
+        "OPS_TOOLBELT_GITHUB_API": f"{server.url}/api",
+        "OPS_TOOLBELT_GITHUB_URL": server.url,
+        "OPS_TOOLBELT_DOWNLOAD_DIR": str(tmp_path / "downloads"),
+        "OPS_TOOLBELT_RETRY_DELAY": "0",
+        **env,
+    })
+    return subprocess.run(
+        ["bash", "-ec", f'source "{INSTALL_LIB}"; {script}'],
+        env=environment, capture_output=True, text=True, check=False,
+    )
+
+
+def test_download_retries_and_resumes(server, tmp_path):
+    content = os.urandom(200_000)
+    server.files["/tool.tar.gz"] = content
+    server.failures["/tool.tar.gz"] = 1
+    server.truncate["/tool.tar.gz"] = 1
+
+    result = run_lib(f'download "{server.url}/tool.tar.gz" "{tmp_path}/tool.tar.gz"', server, tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "tool.tar.gz").read_bytes() == content
+    assert not (tmp_path / "tool.tar.gz.part").exists()
+    ranges = [r for path, r in server.requests if path == "/tool.tar.gz"]
+    assert ranges[:2] == [None, None]
+    assert ranges[2] == f"bytes={len(content) // 2}-"
+
+
+def test_download_gives_up(server, tmp_path):
+    server.files["/tool.tar.gz"] = b"content"
+    server.failures["/tool.tar.gz"] = 10
+
+    result = run_lib(
+        f'download "{server.url}/tool.tar.gz" "{tmp_path}/tool.tar.gz"',
+        server, tmp_path, OPS_TOOLBELT_DOWNLOAD_ATTEMPTS="3",
+    )
+    assert result.returncode != 0
+    assert "failed after 3 attempts" in result.stderr
+    assert len(server.requests) == 3
+
+
+def test_verify_checksum(server, tmp_path):
+    archive = tmp_path / "tool.tar.gz"
+    archive.write_bytes(b"content")
+    digest = hashlib.sha256(b"content").hexdigest()
+    server.files["/sums"] = f"{'0' * 64}  other.tar.gz\n{digest} *tool.tar.gz\n".encode()
+    server.files["/bad"] = f"{'0' * 64}  tool.tar.gz\n".encode()
+
+    ok = run_lib(f'verify_checksum "{archive}" "{server.url}/sums" tool.tar.gz', server, tmp_path)
+    assert ok.returncode == 0, ok.stderr
+
+    missing = run_lib(f'verify_checksum "{archive}" "{server.url}/missing" tool.tar.gz', server, tmp_path)
+    assert missing.returncode == 0
+    assert "skipping the verification" in missing.stderr
+    required = run_lib(
+        f'verify_checksum "{archive}" "{server.url}/missing" tool.tar.gz',
+        server, tmp_path, OPS_TOOLBELT_REQUIRE_CHECKSUM="true",
+    )
+    assert required.returncode != 0
+    known = run_lib(f'verify_checksum "{archive}" "{server.url}/missing" tool.tar.gz required', server, tmp_path)
+    assert known.returncode != 0
+    assert "skipping the verification" not in known.stderr
+
+    bad = run_lib(f'verify_checksum "{archive}" "{server.url}/bad" tool.tar.gz', server, tmp_path)
+    assert bad.returncode != 0
+    assert not archive.exists()
+
+
+def test_latest_version_is_cached(server, tmp_path):
+    server.files["/api/repos/owner/tool/releases/latest"] = json.dumps({"tag_name": "v1.2.3"}).encode()
+
+    for _ in range(2):
+        result = run_lib("latest_version tool owner/tool", server, tmp_path)
+        assert result.stdout.strip() == "v1.2.3", result.stderr
+    assert len(server.requests) == 1
+    assert (tmp_path / "xdg" / "ops-toolbelt" / "tool" / "latest").read_text().strip() == "v1.2.3"
+
+    stale = run_lib("latest_version tool owner/tool", server, tmp_path, OPS_TOOLBELT_CACHE_LATEST_TTL="0")
+    assert stale.stdout.strip() == "v1.2.3"
+    assert len(server.requests) == 2
+
+    # Pods on the node share the node cache, the latest version stays in the cache of the user
+    node_cache = tmp_path / "node-cache"
+    (node_cache / "tool").mkdir(parents=True)
+    (node_cache / "tool" / "latest").write_text("v0.0.1\n")
+    shared = run_lib("latest_version tool owner/tool", server, tmp_path, OPS_TOOLBELT_CACHE_DIR=str(node_cache))
+    assert shared.stdout.strip() == "v1.2.3"
+
+
+def test_install_release_uses_the_node_cache(server, tmp_path):
+    archive = release_archive("tool-v1/tool", b"#!/bin/sh\necho tool\n")
+    server.files["/releases/v1/tool.tar.gz"] = archive
+    server.files["/releases/v1/SHA256SUMS"] = f"{hashlib.sha256(archive).hexdigest()}  tool.tar.gz\n".encode()
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    entry = cache / "tool" / "v1" / "linux-amd64"
+    install = (
+        f'install_release tool v1 linux amd64 "{server.url}/releases/v1/tool.tar.gz" '
+        f'"{server.url}/releases/v1/SHA256SUMS" tool-v1/tool "{tmp_path}/$DEST" required'
+    )
+
+    def downloads() -> int:
+        return sum(path == "/releases/v1/tool.tar.gz" for path, _ in server.requests)
+
+    first = run_lib(install, server, tmp_path, OPS_TOOLBELT_CACHE_DIR=str(cache), DEST="first")
+    assert first.returncode == 0, first.stderr
+    assert subprocess.run([tmp_path / "first"], capture_output=True, text=True).stdout == "tool\n"
+    assert (entry / "tool").read_bytes() == (tmp_path / "first").read_bytes()
+    assert (entry / "sha256").is_file()
+    assert not any((tmp_path / "downloads").rglob("*.tar.gz*"))
+    assert downloads() == 1
+
+    # A corrupted entry is replaced by a new download
+    (entry / "tool").write_bytes(b"#!/bin/sh\necho corrupted\n")
+    corrupted = run_lib(install, server, tmp_path, OPS_TOOLBELT_CACHE_DIR=str(cache), DEST="second")
+    assert corrupted.returncode == 0, corrupted.stderr
+    assert "does not match its sha256 sum" in corrupted.stderr
+    assert subprocess.run([tmp_path / "second"], capture_output=True, text=True).stdout == "tool\n"
+    assert downloads() == 2
+
+    # Without the checksum list a required download is not installed
+    (tmp_path / "empty").mkdir()
+    unverified = run_lib(
+        install.replace("SHA256SUMS", "missing"), server, tmp_path,
+        OPS_TOOLBELT_CACHE_DIR=str(tmp_path / "empty"), DEST="unverified",
+    )
+    assert unverified.returncode != 0
+    assert not (tmp_path / "unverified").exists()
+    assert not any((tmp_path / "downloads").rglob("*.tar.gz*"))
+
+    # Later installs on the node need no network and hardlink the cached binary
+    server.shutdown()
+    server.server_close()
+    offline = run_lib(install, server, tmp_path, OPS_TOOLBELT_CACHE_DIR=str(cache), DEST="third")
+    assert offline.returncode == 0, offline.stderr
+    assert "from the node cache" in offline.stdout
+    assert (tmp_path / "third").stat().st_ino == (entry / "tool").stat().st_ino
+    assert subprocess.run([tmp_path / "third"], capture_output=True, text=True).stdout == "tool\n"
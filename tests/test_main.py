@@ -4,11 +4,21 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import json
 from pathlib import Path
 
 import pytest
+import yaml
+from pydantic import ValidationError
 
-from generator.main import collect_validation_commands
+import generator.main
+
+from generator.main import (
+    GeneratorSettings,
+    ValidationGeneratorSettings,
+    collect_validation_checks,
+    collect_validation_commands,
+)
 from generator.models import (
     AptGetItemList,
     BashItemList,
@@ -104,11 +114,7 @@ def test_collect_validation_commands_empty():
     assert result == []
 
 
-def test_collect_validation_commands_mixed(mocker):
-    mocker.patch("pathlib.Path.is_file", return_value=True)
-    mocker.patch("pathlib.Path.is_dir", return_value=True)
-    mocker.patch("pathlib.Path.exists", return_value=True)
-
+def test_collect_validation_commands_mixed(tmp_path):
     components = [
         AptGetItemList.model_validate({
             "name": "apt-get",
@@ -136,7 +142,7 @@ def test_collect_validation_commands_mixed(mocker):
             "items": [
                 {
                     "name": "scripts",
-                    "from": "/src",
+                    "from": str(tmp_path),
                     "to": "/dst",
                     "validation_command": "test -d /dst",
                 },
@@ -173,7 +179,7 @@ def test_generate_validation_dockerfile(tmp_path, mocker):
 
     mocker.patch(
         "generator.main.ValidationGeneratorSettings",
-        return_value=mocker.Mock(
+        return_value=ValidationGeneratorSettings.model_construct(
             dockerfile_config=config_file,
             from_image="my-image:latest",
             dockerfile=output_file,
@@ -193,3 +199,330 @@ def test_generate_validation_dockerfile(tmp_path, mocker):
         "# Validate: setup\n"
         "RUN echo ok\n"
     )
+
+
+def test_generate_dockerfile_incremental(tmp_path, mocker, capsys):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("""
+- name: bash
+  items:
+  - name: setup
+    command: echo hi
+""")
+    output_file = tmp_path / "Dockerfile"
+    settings = GeneratorSettings.model_construct(
+        dockerfile_config=config_file,
+        dockerfile=output_file,
+        incremental=True,
+        manifest=tmp_path / "manifest.json",
+        ghelp_info_file=True,
+        build_context=tmp_path,
+    )
+    mocker.patch("generator.main.GeneratorSettings", return_value=settings)
+    dockerfile_spy = mocker.spy(generator.main, "Dockerfile")
+
+    generator.main.generate_dockerfile()
+    assert "1 of 1 components changed" in capsys.readouterr().out
+    assert dockerfile_spy.call_count == 1
+    content = output_file.read_text()
+
+    generator.main.generate_dockerfile()
+    assert "Nothing changed" in capsys.readouterr().out
+    assert dockerfile_spy.call_count == 1
+    assert output_file.read_text() == content
+
+    output_file.write_text("tampered")
+    generator.main.generate_dockerfile()
+    assert dockerfile_spy.call_count == 2
+    assert output_file.read_text() == content
+
+    info_file = tmp_path / "Dockerfile.ghelp_info.json"
+    info = info_file.read_text()
+    info_file.unlink()
+    generator.main.generate_dockerfile()
+    assert dockerfile_spy.call_count == 3
+    assert info_file.read_text() == info
+
+    config_file.write_text(config_file.read_text().replace("echo hi", "echo bye"))
+    generator.main.generate_dockerfile()
+    assert "1 of 1 components changed" in capsys.readouterr().out
+    assert "echo bye" in output_file.read_text()
+
+
+def test_generate_validation_dockerfile_runner(tmp_path, mocker):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("""
+- name: bash
+  items:
+  - name: setup
+    command: echo hi
+    validation_command: echo ok
+  - name: other
+    command: echo hi
+    validation_command: echo fine
+""")
+    output_dir = tmp_path / "generated"
+    output_dir.mkdir()
+    output_file = output_dir / "validation.dockerfile"
+    mocker.patch(
+        "generator.main.ValidationGeneratorSettings",
+        return_value=ValidationGeneratorSettings.model_construct(
+            dockerfile_config=config_file,
+            dockerfile=output_file,
+            runner=True,
+            workers=2,
+            check_timeout=60,
+            build_context=tmp_path,
+        ),
+    )
+
+    generator.main.generate_validation_dockerfile()
+
+    assert output_file.read_text() == (
+        "FROM ops-toolbelt AS checks\n"
+        'SHELL ["/bin/bash", "-lic"]\n'
+        "COPY generated/validation.runner.json /var/lib/validation/plan.json\n"
+        "COPY generated/validation_runner.py /var/lib/validation/validation_runner.py\n"
+        "# Validate: all checks in parallel\n"
+        "RUN python3 /var/lib/validation/validation_runner.py /var/lib/validation/plan.json\n"
+        "\n"
+        "FROM scratch AS report\n"
+        "COPY --from=checks /var/lib/validation/report.json /var/lib/validation/report.xml /\n"
+        "\n"
+        "FROM checks\n"
+        "RUN python3 /var/lib/validation/validation_runner.py --verify /var/lib/validation/report.json\n"
+    )
+    plan = json.loads((output_dir / "validation.runner.json").read_text())
+    assert plan["workers"] == 2
+    assert plan["timeout"] == 60
+    assert [(c["name"], c["command"]) for c in plan["checks"]] == [
+        ("setup", "echo ok"),
+        ("other", "echo fine"),
+    ]
+    assert (output_dir / "validation_runner.py").read_text().startswith("#!/usr/bin/env python3")
+
+
+def test_generate_validation_dockerfile_incremental(tmp_path, mocker, capsys, subtests):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("""
+- name: bash
+  items:
+  - name: setup
+    command: echo hi
+    validation_command: echo ok
+""")
+    report = tmp_path / "report.json"
+    report.write_text(json.dumps({"checks": []}))
+    mocker.patch(
+        "generator.main.ValidationGeneratorSettings",
+        return_value=ValidationGeneratorSettings.model_construct(
+            dockerfile_config=config_file,
+            dockerfile=tmp_path / "validation.dockerfile",
+            previous_report=report,
+            runner=True,
+            workers=1,
+            check_timeout=60,
+            build_context=tmp_path,
+            incremental=True,
+            manifest=tmp_path / "manifest.json",
+        ),
+    )
+    generator.main.generate_validation_dockerfile()
+    generator.main.generate_validation_dockerfile()
+    assert "Nothing changed" in capsys.readouterr().out
+
+    for name, change in [
+        ("Changed previous report", lambda: report.write_text(json.dumps({"checks": [{}]}))),
+        ("Edited runner plan", lambda: (tmp_path / "validation.runner.json").write_text("{}")),
+        ("Deleted runner", lambda: (tmp_path / "validation_runner.py").unlink()),
+    ]:
+        with subtests.test(name):
+            change()
+            generator.main.generate_validation_dockerfile()
+            assert "Nothing changed" not in capsys.readouterr().out
+            assert (tmp_path / "validation_runner.py").is_file()
+
+
+def test_generate_validation_dockerfile_skips_cached_passes(tmp_path, mocker, subtests):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("""
+- name: curl
+  items:
+  - name: kubectl
+    version: v1
+    from: http://example.com/{version}/kubectl
+    validation_command: kubectl version --client
+  - name: tool
+    from: http://example.com/tool
+    validation_command: tool --version
+""")
+    components = Dockerfile(
+        dockerfile_file=Path("/dev/null"), components=yaml.safe_load(config_file.read_text())
+    ).components
+    kubectl, tool = collect_validation_checks(components, "ops-toolbelt")
+    report = tmp_path / "report.json"
+    report.write_text(json.dumps({"checks": [
+        {**kubectl.model_dump(), "status": "passed", "duration": 1.0},
+        {**tool.model_dump(), "status": "failed", "duration": 1.0},
+    ]}))
+    output_file = tmp_path / "Dockerfile.validation"
+
+    def generate(**kwargs) -> str:
+        mocker.patch(
+            "generator.main.ValidationGeneratorSettings",
+            return_value=ValidationGeneratorSettings.model_construct(
+                dockerfile_config=config_file,
+                dockerfile=output_file,
+                previous_report=report,
+                **kwargs,
+            ),
+        )
+        generator.main.generate_validation_dockerfile()
+        return output_file.read_text()
+
+    with subtests.test("Passed check with unchanged definition is skipped"):
+        content = generate()
+        assert "kubectl version --client" not in content
+        assert "RUN tool --version" in content
+
+    with subtests.test("Full validation"):
+        content = generate(full=True)
+        assert "RUN kubectl version --client" in content
+
+    with subtests.test("Cached passes are carried over into the runner report"):
+        generate(runner=True, workers=1, check_timeout=60, build_context=tmp_path)
+        plan = json.loads((tmp_path / "Dockerfile.runner.json").read_text())
+        assert [c["name"] for c in plan["checks"]] == ["tool"]
+        assert plan["cached"] == [{**kubectl.model_dump(), "duration": 1.0}]
+
+    with subtests.test("Another base image invalidates the cached pass"):
+        content = generate(from_image="ops-toolbelt:next")
+        assert "RUN kubectl version --client" in content
+
+    with subtests.test("Version bump invalidates the cached pass"):
+        config_file.write_text(config_file.read_text().replace("version: v1", "version: v2"))
+        content = generate()
+        assert "RUN kubectl version --client" in content
+
+
+def test_generate_dockerfile_profile(tmp_path, mocker, capsys):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("""
+- name: apt-get
+  items:
+  - jq
+- name: curl
+  items:
+  - name: kubectl
+    from: http://example.com/kubectl
+""")
+
+    def generate(output: Path, **kwargs) -> str:
+        mocker.patch(
+            "generator.main.GeneratorSettings",
+            return_value=GeneratorSettings.model_construct(
+                dockerfile_config=config_file, dockerfile=output, **kwargs
+            ),
+        )
+        generator.main.generate_dockerfile()
+        return output.read_text()
+
+    plain = generate(tmp_path / "plain")
+    assert "Profile of" not in capsys.readouterr().out
+
+    assert generate(tmp_path / "profiled", profile=True) == plain
+    out = capsys.readouterr().out
+    for line in [
+        "yaml.safe_load", "layer grouping", "file emission", "apt-get", "curl", "ShellAwareHttpUrl.validate",
+    ]:
+        assert f"    {line}" in out
+
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_generate_dockerfile_ghelp_info_file(tmp_path, mocker, snapshot):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("""
+- name: bash
+  items:
+  - name: setup
+    command: echo hi
+    info: Notes about setup
+""")
+    output_file = tmp_path / "out" / "Dockerfile"
+    output_file.parent.mkdir()
+    mocker.patch(
+        "generator.main.GeneratorSettings",
+        return_value=GeneratorSettings.model_construct(
+            dockerfile_config=config_file,
+            dockerfile=output_file,
+            ghelp_info_file=True,
+            build_context=tmp_path,
+            ghelp_resolve_command="python3 /hacks/ghelp --resolve",
+            snapshot=tmp_path / "snapshot.json" if snapshot else None,
+        ),
+    )
+    generator.main.generate_dockerfile()
+
+    assert output_file.read_text().splitlines()[-3:] == [
+        "RUN echo hi",
+        "RUN --mount=type=bind,source=out/Dockerfile.ghelp_info.json,target=/tmp/ghelp_info.json "
+        "cp /tmp/ghelp_info.json /var/lib/ghelp_info;\\",
+        "    python3 /hacks/ghelp --resolve",
+    ]
+    info = json.loads((tmp_path / "out" / "Dockerfile.ghelp_info.json").read_text())
+    assert info["downloaded"] == [["setup", None, "Notes about setup"]]
+
+
+def test_generate_dockerfile_from_snapshot(tmp_path, mocker):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("""
+- name: curl
+  items:
+  - name: kubectl
+    version: v1
+    from: http://example.com/{version}/kubectl
+- name: bash
+  items:
+  - name: setup
+    command: echo hi
+""")
+    snapshot = tmp_path / "snapshot.json"
+    validate_spy = mocker.spy(generator.main, "validate_components")
+
+    mocker.patch(
+        "generator.main.ValidateSettings",
+        return_value=generator.main.ValidateSettings.model_construct(
+            dockerfile_config=config_file, snapshot=snapshot
+        ),
+    )
+    generator.main.validate()
+    assert snapshot.is_file()
+    assert validate_spy.call_count == 1
+
+    def generate(output: Path, **kwargs) -> str:
+        mocker.patch(
+            "generator.main.GeneratorSettings",
+            return_value=GeneratorSettings.model_construct(
+                dockerfile_config=config_file, dockerfile=output, **kwargs
+            ),
+        )
+        generator.main.generate_dockerfile()
+        return output.read_text()
+
+    restored = generate(tmp_path / "restored", snapshot=snapshot)
+    assert validate_spy.call_count == 1
+    assert restored == generate(tmp_path / "validated")
+    assert validate_spy.call_count == 2
+
+    config_file.write_text(config_file.read_text().replace("version: v1", "version: v2"))
+    assert "/v2/kubectl" in generate(tmp_path / "changed", snapshot=snapshot)
+    assert validate_spy.call_count == 3
+
+
+def test_download_stages_require_an_image(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text("[]")
+    args = {"dockerfile_config": config_file, "dockerfile": tmp_path / "Dockerfile", "download_stages": True}
+    with pytest.raises(ValidationError, match="--download-stage-image"):
+        GeneratorSettings(_cli_parse_args=[], **args)
+    assert GeneratorSettings(_cli_parse_args=[], download_stage_image="curl:latest", **args)
@@ -4,13 +4,17 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import json
 from pathlib import Path
 from pydantic import ValidationError
 import pytest
+import yaml
 
 
 from generator import models as m
 
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
 
 def test_package_name_string_validator():
     assert m.package_name_string_validator("valid-name_123") == "valid-name_123"
@@ -132,6 +136,73 @@ def test_apt_get_item_list(subtests):
             })
 
 
+def test_apt_get_item_list_acceleration(subtests):
+    mounts = (
+        "--mount=type=cache,target=/var/cache/apt,sharing=locked "
+        "--mount=type=cache,target=/var/lib/apt/lists,sharing=locked "
+    )
+    with subtests.test("Disabled profile renders the plain layer"):
+        plain = m.AptGetItemList.model_validate({"name": "apt-get", "items": ["abc"]})
+        assert plain.acceleration is None
+        assert plain.can_be_combined
+        assert plain.to_dockerfile_directive() == (
+            "RUN apt-get --yes update && apt-get --yes install abc;\\\n    rm -rf /var/lib/apt/lists"
+        )
+
+    with subtests.test("Cache mounts"):
+        a = m.AptGetItemList.model_validate({
+            "name": "apt-get", "items": ["abc", {"name": "def"}], "acceleration": {},
+        })
+        assert not a.can_be_combined
+        assert a.to_dockerfile_directive() == (
+            f"RUN {mounts}rm -f /etc/apt/apt.conf.d/docker-clean;\\\n"
+            "    apt-get -o APT::Keep-Downloaded-Packages=true --yes update"
+            " && apt-get -o APT::Keep-Downloaded-Packages=true --yes install abc def"
+        )
+
+    with subtests.test("Proxy, recommends and pipelining without mounts"):
+        a = m.AptGetItemList.model_validate({
+            "name": "apt-get",
+            "items": ["abc"],
+            "apt-get-command": "apt-get install",
+            "acceleration": {
+                "cache_mounts": False,
+                "proxy_arg": "APT_PROXY",
+                "no_install_recommends": True,
+                "pipeline_depth": 5,
+            },
+        })
+        assert not a.can_be_combined
+        assert a.to_dockerfile_directive() == (
+            "ARG APT_PROXY\n"
+            "RUN apt-get -o Acquire::http::Pipeline-Depth=5"
+            " ${APT_PROXY:+-o Acquire::http::Proxy=${APT_PROXY} -o Acquire::https::Proxy=${APT_PROXY}}"
+            " install --no-install-recommends abc;\\\n    rm -rf /var/lib/apt/lists"
+        )
+
+    with subtests.test("Options only can still be combined"):
+        a = m.AptGetItemList.model_validate({
+            "name": "apt-get",
+            "items": ["abc"],
+            "acceleration": {"cache_mounts": False, "no_install_recommends": True},
+        })
+        assert a.can_be_combined
+        assert a.to_shortened_dockerfile_directive() == (
+            "apt-get --yes update && apt-get --yes install --no-install-recommends abc;\\\n"
+            "    rm -rf /var/lib/apt/lists"
+        )
+
+    with subtests.test("Invalid profile"):
+        with pytest.raises(ValidationError):
+            m.AptGetItemList.model_validate({
+                "name": "apt-get", "items": ["abc"], "acceleration": {"proxy_arg": "not valid"},
+            })
+        with pytest.raises(ValidationError):
+            m.AptGetItemList.model_validate({
+                "name": "apt-get", "items": ["abc"], "acceleration": {"pipeline_depth": 0},
+            })
+
+
 def test_shell_aware_http_url(subtests):
     with subtests.test("Valid URL"):
         url = m.ShellAwareHttpUrl("http://example.com")
@@ -261,6 +332,65 @@ def test_curl_item_list(subtests):
             })
 
 
+def test_curl_item_download_stage(subtests):
+    with subtests.test("Default artifact"):
+        c = m.CurlItem.model_validate({
+            "name": "Kube ctl",
+            "version": "v1",
+            "from": "http://example.com/{version}/kubectl-${{TARGETARCH}}",
+        })
+        assert c.stage_name == "download-kube-ctl"
+        assert c.to_download_stage("base:latest", ["TARGETARCH"]) == (
+            "FROM base:latest AS download-kube-ctl\n"
+            "USER root\n"
+            "WORKDIR /\n"
+            "ARG TARGETARCH\n"
+            "RUN curl -sLf http://example.com/v1/kubectl-${TARGETARCH} -o /bin/Kube ctl"
+            " && chmod 755 /bin/Kube ctl"
+        )
+        assert c.to_copy_from_stage_directive() == (
+            "COPY --from=download-kube-ctl /bin/Kube ctl /bin/Kube ctl"
+        )
+
+    with subtests.test("Declared artifacts"):
+        c = m.CurlItem.model_validate({
+            "name": "tool",
+            "from": "http://example.com/tool.tar.gz",
+            "to": "/tool.tar.gz",
+            "command": "tar Cxzf /usr/local/bin /tool.tar.gz",
+            "artifacts": ["/usr/local/bin/tool", "/etc/tool"],
+        })
+        assert c.to_copy_from_stage_directive() == (
+            "COPY --from=download-tool /usr/local/bin/tool /usr/local/bin/tool\n"
+            "COPY --from=download-tool /etc/tool /etc/tool"
+        )
+
+    with subtests.test("Relative paths of the nerdctl command resolve in /"):
+        config = yaml.safe_load((REPO_ROOT / "dockerfile-configs" / "common-components.yaml").read_text())
+        curl = next(c for c in config if c["name"] == "curl")
+        nerdctl = m.CurlItem.model_validate(next(i for i in curl["items"] if i["name"] == "nerdctl"))
+        stage = nerdctl.to_download_stage("curl:latest", ["TARGETARCH"]).splitlines()
+        assert stage[:4] == ["FROM curl:latest AS download-nerdctl", "USER root", "WORKDIR /", "ARG TARGETARCH"]
+        assert stage[4].startswith("RUN curl -sLf https://github.com/containerd/nerdctl/")
+        assert "-o /nerdctl.tar.gz && tar Cxzvvf /usr/local/bin nerdctl.tar.gz" in stage[4]
+
+    with subtests.test("Stage copy list"):
+        cil = m.CurlItemList.model_validate({
+            "name": "curl",
+            "items": [
+                {"name": "a", "from": "http://example.com/a"},
+                {"name": "b", "from": "http://example.com/b"},
+            ],
+        })
+        assert len(cil.to_download_stages("base", [])) == 2
+        copies = m.CurlStageCopyList(items=cil.items)
+        assert copies.to_dockerfile_directive() == (
+            "COPY --from=download-a /bin/a /bin/a\n"
+            "COPY --from=download-b /bin/b /bin/b"
+        )
+        assert copies.to_ghelp_format() == cil.to_ghelp_format()
+
+
 def test_env_item_list(subtests):
     with subtests.test("Valid EnvItemList"):
         eil = m.EnvItemList(
@@ -565,6 +695,18 @@ def test_info_generator_to_ghelp_format():
             ("tool1", "1.0.0", "Tool info"),
             ("script1", None, "Script info"),
         ],
+        "index": {
+            "bin1": [["apt", "bin1"]],
+            "info": [["downloaded", "tool1"], ["downloaded", "script1"]],
+            "pkg1": [["apt", "bin1"]],
+            "pkg2": [["apt", "pkg2"]],
+            "script": [["downloaded", "script1"]],
+            "script1": [["downloaded", "script1"]],
+            "tool": [["downloaded", "tool1"]],
+            "tool1": [["downloaded", "tool1"]],
+        },
+        "on_demand": [],
+        "hacks": [],
     }
     assert result == expected
 
@@ -580,6 +722,9 @@ def test_info_generator_to_ghelp_format_empty():
         "apt": [],
         "pip": [],
         "downloaded": [],
+        "index": {},
+        "on_demand": [],
+        "hacks": [],
     }
     assert result == expected
 
@@ -604,6 +749,13 @@ def test_info_generator_to_ghelp_format_apt_only():
         ],
         "pip": [],
         "downloaded": [],
+        "index": {
+            "pkg1": [["apt", "pkg1"]],
+            "pkg2": [["apt", "pkg2"]],
+            "pkg3": [["apt", "pkg3"]],
+        },
+        "on_demand": [],
+        "hacks": [],
     }
     assert result == expected
 
@@ -641,8 +793,66 @@ def test_info_generator_to_ghelp_format_downloaded_only():
             ("tool1", None, None),
             ("script1", None, None),
         ],
+        "index": {
+            "script1": [["downloaded", "script1"]],
+            "tool1": [["downloaded", "tool1"]],
+        },
+        "on_demand": [],
+        "hacks": [],
     }
     assert result == expected
+
+
+def test_info_generator_on_demand_registry(tmp_path):
+    """Test InfoGenerator lists on-demand tools and copied scripts with their sizes"""
+    hacks = tmp_path / "hacks"
+    hacks.mkdir()
+    (hacks / "install_tool").write_text("#!/bin/bash\necho install\n")
+    ops_pod = "#!/bin/bash -e\n\n# SPDX-License-Identifier: Apache-2.0\n\n# open terminal\n"
+    (hacks / "ops-pod").write_text(ops_pod)
+    (hacks / "notes.txt").write_text("not a script")
+    (hacks / "install-lib").write_text("# sourced by the install scripts\n")
+    (hacks / "debug").mkdir()
+    (hacks / "debug" / "trace").write_text("#!/bin/bash\n# trace a pod\n")
+    for script in ("install_tool", "ops-pod", "debug/trace"):
+        (hacks / script).chmod(0o755)
+
+    info_gen = m.InfoGenerator.model_validate({
+        "components": [
+            {
+                "name": "copy",
+                "items": [
+                    {"name": "hacks", "from": str(hacks), "to": "/hacks"},
+                    {"name": "install-lib", "from": str(hacks / "install-lib"), "to": "/nonroot/hacks"},
+                    {
+                        "name": "install_tool",
+                        "from": str(hacks / "install_tool"),
+                        "to": "/nonroot/hacks",
+                        "info": "Installs tool",
+                        "on_demand": {"binary": "tool", "download_mb": 12.5},
+                    },
+                ],
+            },
+        ],
+    })
+
+    result = info_gen.to_ghelp_format()
+    assert result["on_demand"] == [{
+        "name": "tool",
+        "installer": "/nonroot/hacks/install_tool",
+        "bytes": 25,
+        "download_mb": 12.5,
+        "install_seconds": None,
+        "info": "Installs tool",
+    }]
+    # Directories and sourced libraries are no tools of their own
+    assert result["downloaded"] == [("install_tool", None, "Installs tool")]
+    assert result["hacks"] == [
+        {"name": "trace", "path": "/hacks/debug/trace", "bytes": 26, "info": "trace a pod"},
+        {"name": "ops-pod", "path": "/hacks/ops-pod", "bytes": len(ops_pod), "info": "open terminal"},
+    ]
+
+
 def test_validation_command_on_bash_item():
     item = m.BashItem(name="test", command="echo hello", validation_command="echo hello")
     assert item.validation_command == "echo hello"
@@ -704,3 +914,85 @@ def test_info_multiline_string_validator():
         == "line1\\nline2\\nline3"
     )
     assert m.info_multiline_string_validator("a\n\nb") == "a\\nb"
+
+
+def test_item_fingerprint():
+    def curl(**kwargs):
+        return m.CurlItem.model_validate({
+            "name": "tool",
+            "version": "1.0",
+            "from": "http://example.com/tool-{version}",
+            "validation_command": "tool --version",
+            **kwargs,
+        })
+
+    base = curl().fingerprint()
+    assert curl().fingerprint() == base
+    assert curl(info="changed notes").fingerprint() == base
+    assert curl(version="1.1").fingerprint() != base
+    assert curl(command="echo extra").fingerprint() != base
+    assert curl(validation_command="tool version").fingerprint() != base
+    assert curl(**{"from": "http://mirror.example.com/tool-{version}"}).fingerprint() != base
+
+    apt = m.AptGetItem(name="jq", validation_command="jq --version")
+    assert apt.fingerprint() != m.AptGetItem(name="jq", validation_command="jq -V").fingerprint()
+    assert apt.fingerprint("base") != apt.fingerprint()
+
+
+def test_copy_item_fingerprint_covers_content(tmp_path):
+    script = tmp_path / "script"
+    script.write_text("echo one\n")
+    item = m.CopyItem.model_validate(
+        {"name": "script", "from": script, "to": "/script", "validation_command": "/script"}
+    )
+    base = item.fingerprint()
+    script.write_text("echo two\n")
+    assert item.fingerprint() != base
+
+
+def test_info_generator_resolve_command():
+    """Test InfoGenerator runs the resolve command after writing the ghelp info"""
+    components = [{"name": "apt-get", "items": ["pkg1"]}]
+    plain = m.InfoGenerator.model_validate({"components": components})
+    assert plain.to_shortened_dockerfile_directive() == (
+        """echo '{"apt": [["pkg1", "pkg1"]], "pip": [], "downloaded": [], """
+        """"index": {"pkg1": [["apt", "pkg1"]]}, "on_demand": [], "hacks": []}' > /var/lib/ghelp_info"""
+    )
+
+    resolving = m.InfoGenerator.model_validate({
+        "components": components,
+        "resolve_command": "python3 /hacks/ghelp --resolve",
+    })
+    assert resolving.to_shortened_dockerfile_directive() == (
+        plain.to_shortened_dockerfile_directive() + ";\\\n    python3 /hacks/ghelp --resolve"
+    )
+
+
+def test_info_generator_info_file():
+    """Test InfoGenerator copies a generated ghelp info in its own layer"""
+    components = [{"name": "apt-get", "items": ["pkg1"]}]
+    copied = m.InfoGenerator.model_validate({"components": components, "info_file": "ghelp_info.json"})
+    assert copied.key == "COPY"
+    assert not copied.can_be_combined
+    assert copied.to_dockerfile_directive() == "COPY ghelp_info.json /var/lib/ghelp_info"
+    assert json.loads(copied.to_ghelp_json()) == json.loads(json.dumps(copied.to_ghelp_format()))
+
+    resolving = m.InfoGenerator.model_validate({
+        "components": components,
+        "info_file": "ghelp_info.json",
+        "resolve_command": "python3 /hacks/ghelp --resolve",
+    })
+    # A single layer is rebuilt when the info changes
+    assert resolving.key == "RUN"
+    assert not resolving.can_be_combined
+    assert resolving.to_dockerfile_directive() == (
+        "RUN --mount=type=bind,source=ghelp_info.json,target=/tmp/ghelp_info.json "
+        "cp /tmp/ghelp_info.json /var/lib/ghelp_info;\\\n    python3 /hacks/ghelp --resolve"
+    )
+
+
+def test_ghelp_tokens():
+    """Test search tokens of ghelp texts"""
+    assert m.ghelp_tokens("vim-tiny") == {"vim-tiny", "vim", "tiny"}
+    assert m.ghelp_tokens("A TUI for k8s.\\nSee `k9s --help`") == {"tui", "for", "k8s", "see", "k9s", "help"}
+    assert m.ghelp_tokens("a b") == set()
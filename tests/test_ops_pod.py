@@ -0,0 +1,426 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+import yaml
+
+OPS_POD = Path(__file__).resolve().parent.parent / "hacks" / "ops-pod"
+
+pytestmark = pytest.mark.skipif(shutil.which("bash") is None, reason="needs bash")
+
+# Stand-in for kubectl that logs its arguments, replays pod events for watches, answers pod lookups
+# with the content of the pod file, keeps the created manifests, runs fan-out commands per node and
+# replays the events of pre-pull pods and the Pulled event of the pod with the uid uid-1
+FAKE_KUBECTL = r"""#!/bin/bash
+echo "$*" >> "${FAKE_KUBECTL_DIR}/calls"
+case "$*" in
+config\ current-context) echo fake ;;
+config\ view*) sleep "${FAKE_KUBECTL_CONFIG_DELAY:-0}"; echo fake-namespace ;;
+get\ nodes\ -o\ jsonpath*) echo "${FAKE_KUBECTL_NODES:-node-1 node-2}" ;;
+*\ get\ pod\ *--watch*) cat "${FAKE_KUBECTL_DIR}/events" 2> /dev/null ;;
+*\ get\ pod\ *metadata.uid*) echo uid-1 ;;
+*\ get\ pod\ *) cat "${FAKE_KUBECTL_DIR}/pod" 2> /dev/null ;;
+get\ nodes\ -l\ *) echo "${FAKE_KUBECTL_NODES:-node-1 node-2}" ;;
+get\ nodes\ *images*) echo "${FAKE_KUBECTL_IMAGES}" ;;
+*\ get\ events\ *involvedObject.uid=uid-1,*) echo "${FAKE_KUBECTL_PULLED}" ;;
+*\ get\ pods\ -l\ *--watch*) cat "${FAKE_KUBECTL_DIR}/prepull" 2> /dev/null ;;
+create\ -f\ *)
+  manifest="$(cat "${@: -1}")"
+  echo "${manifest}" > "${FAKE_KUBECTL_DIR}/manifest"
+  mkdir -p "${FAKE_KUBECTL_DIR}/pods"
+  echo "${manifest}" > "${FAKE_KUBECTL_DIR}/pods/$(awk '/^  name:/ { print $2; exit }' <<< "${manifest}")"
+  ;;
+*\ exec\ *)
+  if [ ! -f "${FAKE_KUBECTL_DIR}/pods/${4}" ]; then
+    echo "shell on ${3}"
+    exit
+  fi
+  # fan-out: answer for the node of the pod and record how many commands run at the same time
+  node="$(awk '/kubernetes.io\/hostname:/ { print $2 }' "${FAKE_KUBECTL_DIR}/pods/${4}")"
+  if [ -n "${FAKE_KUBECTL_HANG}" ]; then
+    sleep 60 &
+    echo "$!" > "${FAKE_KUBECTL_DIR}/hanging/${node}"
+    wait
+  fi
+  mkdir -p "${FAKE_KUBECTL_DIR}/active"
+  touch "${FAKE_KUBECTL_DIR}/active/$$"
+  ls "${FAKE_KUBECTL_DIR}/active" | wc -l >> "${FAKE_KUBECTL_DIR}/concurrency"
+  sleep 0.05
+  rm "${FAKE_KUBECTL_DIR}/active/$$"
+  echo "${*:6} on ${node}"
+  case "${node}" in
+  bad-*) echo "failed on ${node}" >&2; exit 3 ;;
+  esac
+  ;;
+esac
+"""
+
+
+def fake_kubectl(tmp_path: Path) -> Path:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    kubectl = bin_dir / "kubectl"
+    kubectl.write_text(FAKE_KUBECTL)
+    kubectl.chmod(0o755)
+    return bin_dir
+
+
+def run_ops_pod(
+    tmp_path: Path, *args: str, events: list[str] | None = None, **env: str
+) -> subprocess.CompletedProcess:
+    bin_dir = tmp_path / "bin"
+    if not bin_dir.exists():
+        fake_kubectl(tmp_path)
+    if events is not None:
+        (tmp_path / "events").write_text("".join(f"{event}\n" for event in events))
+    env = {
+        **os.environ, "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}", "FAKE_KUBECTL_DIR": str(tmp_path), **env,
+    }
+    return subprocess.run(
+        [str(OPS_POD), *args], env=env, capture_output=True, text=True, check=False, timeout=120
+    )
+
+
+def calls(tmp_path: Path) -> list[str]:
+    return (tmp_path / "calls").read_text().splitlines()
+
+
+def test_ops_pod_waits_for_running(tmp_path):
+    result = run_ops_pod(
+        tmp_path, "node-1", "--start-timeout", "90s",
+        events=["Pending||", "Pending|ContainerCreating|", "Running||"],
+    )
+    assert result.returncode == 0, result.stderr
+    assert "Waiting for pod to be running (ContainerCreating)..." in result.stdout
+    assert result.stdout.rstrip().endswith("shell on exec")
+
+    log = calls(tmp_path)
+    delete, create, watch = log[3:6]
+    assert delete.startswith("-n fake-namespace delete pod ops-pod-")
+    assert "--ignore-not-found --wait=true --timeout=90s" in delete
+    assert create.startswith("create -f ")
+    assert "get pod" in watch and "--watch --request-timeout=90s" in watch
+    assert sum("get pod" in call for call in log) == 1
+    assert not any("get events" in call for call in log)
+    assert "kubernetes.io/hostname: node-1" in (tmp_path / "manifest").read_text()
+    assert "--wait=false" in log[-1]
+
+
+@pytest.mark.parametrize(
+    "event, error",
+    [
+        ("Pending|ImagePullBackOff|||Back-off pulling image \"nope\"",
+         "cannot start, ImagePullBackOff: Back-off pulling image \"nope\""),
+        ("Pending||Unschedulable||0/2 nodes are available: 1 Insufficient cpu.",
+         "cannot be scheduled: 0/2 nodes are available: 1 Insufficient cpu."),
+        ("Failed||", "is Failed"),
+    ],
+)
+def test_ops_pod_fails_fast(tmp_path, event, error):
+    result = run_ops_pod(tmp_path, "node-1", events=["Pending||", event, "Running||"])
+    assert result.returncode == 1
+    assert error in result.stderr
+    log = calls(tmp_path)
+    assert not any(" exec " in call for call in log)
+    assert "--wait=false" in log[-1]
+
+
+def test_ops_pod_watch_ends_before_running(tmp_path):
+    result = run_ops_pod(tmp_path, "node-1", "--start-timeout", "1s", events=["Pending||"])
+    assert result.returncode == 1
+    assert "is not running after 1s" in result.stderr
+
+
+def test_ops_pod_without_version_file(tmp_path):
+    script = tmp_path / "hacks" / "ops-pod"
+    script.parent.mkdir()
+    shutil.copy(OPS_POD, script)
+    fake_kubectl(tmp_path)
+    (tmp_path / "events").write_text("Running||\n")
+    result = subprocess.run(  # nosec B603
+        [str(script), "node-1"],
+        env={**os.environ, "PATH": f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}", "FAKE_KUBECTL_DIR": str(tmp_path)},
+        input="", capture_output=True, text=True, check=False, timeout=60,
+    )
+    assert result.stdout.rstrip().endswith("shell on exec"), result.stderr
+
+
+def test_ops_pod_unknown_node(tmp_path):
+    result = run_ops_pod(tmp_path, "node-3")
+    assert result.returncode == 2
+    assert not any("create" in call for call in calls(tmp_path))
+
+
+def test_ops_pod_reuse(tmp_path):
+    first = run_ops_pod(tmp_path, "--reuse", "--idle-ttl", "15", "node-1", events=["Running||"])
+    assert first.returncode == 0, first.stderr
+    manifest = yaml.safe_load((tmp_path / "manifest").read_text())
+    labels = manifest["metadata"]["labels"]
+    assert labels["ops-toolbelt.gardener.cloud/reuse"] == "true"
+    command = manifest["spec"]["containers"][0]["command"]
+    assert command[:2] == ["sh", "-c"] and "-mmin +15" in command[2]
+    log = calls(tmp_path)
+    assert " exec " in log[-1] and "/proc/$$/stat" in log[-1]
+    assert not any("--wait=false" in call for call in log)
+    name = manifest["metadata"]["name"]
+
+    # A second session attaches to the running pod without a node lookup, delete or create
+    (tmp_path / "calls").unlink()
+    (tmp_path / "pod").write_text(f"Running/{labels['ops-toolbelt.gardener.cloud/spec']}")
+    second = run_ops_pod(tmp_path, "--reuse", "--idle-ttl", "15", "node-1")
+    assert second.returncode == 0, second.stderr
+    assert "Attaching to the running ops pod on node-1" in second.stdout
+    log = calls(tmp_path)
+    assert len(log) == 4
+    assert not any("create" in call or "delete" in call or "get nodes" in call for call in log)
+
+    # Other options need a pod of their own
+    (tmp_path / "calls").unlink()
+    third = run_ops_pod(tmp_path, "--reuse", "-i", "other", "node-1")
+    assert third.returncode == 0, third.stderr
+    assert any(call.startswith("create -f") for call in calls(tmp_path))
+    assert yaml.safe_load((tmp_path / "manifest").read_text())["spec"]["containers"][0]["image"] == "other"
+
+    # Neither other options nor a session without --reuse delete the pod of the first session
+    (tmp_path / "pod").unlink()
+    plain = run_ops_pod(tmp_path, "node-1", events=["Running||"])
+    assert plain.returncode == 0, plain.stderr
+    assert not any(name in call for call in calls(tmp_path) if "delete" in call)
+    assert yaml.safe_load((tmp_path / "manifest").read_text())["metadata"]["name"] != name
+
+
+def test_ops_pod_reuse_sessions(tmp_path):
+    result = run_ops_pod(tmp_path, "--reuse", "--idle-ttl", "15", "node-1", events=["Running||"])
+    assert result.returncode == 0, result.stderr
+    command = yaml.safe_load((tmp_path / "manifest").read_text())["spec"]["containers"][0]["command"][2]
+    session = calls(tmp_path)[-1].split("bash -c ", 1)[1].split("grep ", 1)[0]
+    sessions = tmp_path / "ops-pod-sessions"
+
+    def in_tmp_path(script: str) -> str:
+        return script.replace("/tmp/", f"{tmp_path}/")
+
+    def start_time(pid: int) -> str:
+        return Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[19]
+
+    registered = subprocess.run(
+        ["bash", "-c", in_tmp_path(session) + "echo $$"], capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert (sessions / registered).read_text().strip().isdigit()
+
+    live = subprocess.Popen(["sleep", "60"])
+    try:
+        (sessions / str(live.pid)).write_text(start_time(live.pid))
+        # A recycled PID runs another process than the session that registered it
+        (sessions / str(os.getpid())).write_text("1")
+        subprocess.run(
+            ["sh", "-c", in_tmp_path(command).replace("while sleep 30; do", "for _ in once; do")], check=True,
+        )
+        assert sorted(path.name for path in sessions.iterdir()) == [str(live.pid)]
+    finally:
+        live.kill()
+        live.wait()
+
+
+def test_ops_pod_cleanup(tmp_path):
+    result = run_ops_pod(tmp_path, "--cleanup", "-n", "ops")
+    assert result.returncode == 0, result.stderr
+    user = subprocess.run(["whoami"], capture_output=True, text=True, check=True).stdout.strip()
+    assert calls(tmp_path) == [
+        f"-n ops delete pods -l ops-toolbelt.gardener.cloud/user={user},ops-toolbelt.gardener.cloud/reuse=true --wait=false"
+    ]
+
+
+def test_ops_pod_fan_out(tmp_path):
+    nodes = [f"node-{i}" for i in range(200)] + ["bad-1", "bad-2"]
+    result = run_ops_pod(
+        tmp_path, "--nodes", "role=worker", "--parallel", "50", "-c", "--", "ip", "route",
+        events=["Pending|ContainerCreating|", "Running||"], FAKE_KUBECTL_NODES=" ".join(nodes),
+    )
+    assert result.returncode == 1
+    lines = result.stdout.splitlines()
+    for node in nodes:
+        assert f"[{node}] chroot /host ip route on {node}" in lines
+    assert "Succeeded on 200 of 202 nodes" in result.stdout
+    assert "[bad-1] failed on bad-1" in lines
+    assert "Failed on bad-1 (exit code 3)\nFailed on bad-2 (exit code 3)" in result.stderr
+    assert not any("Waiting for pod" in line for line in lines)
+
+    concurrency = [int(n) for n in (tmp_path / "concurrency").read_text().split()]
+    assert 1 < max(concurrency) <= 50
+    log = calls(tmp_path)
+    assert log[2] == "get nodes -l role=worker -o jsonpath={.items[*].metadata.name}"
+    manifests = list((tmp_path / "pods").iterdir())
+    assert len(manifests) == len(nodes)
+    run = yaml.safe_load(manifests[0].read_text())["metadata"]["labels"]["ops-toolbelt.gardener.cloud/run"]
+    deleted = [call for call in log if " delete pod " in call]
+    assert sorted(call.split()[4] for call in deleted) == sorted(m.name for m in manifests)
+    assert log[-1] == f"-n fake-namespace delete pods -l ops-toolbelt.gardener.cloud/run={run} --ignore-not-found --wait=false"
+
+
+def test_ops_pod_fan_out_node_list(tmp_path):
+    missing = run_ops_pod(tmp_path, "--nodes", "node-1,node-3", "--", "uptime")
+    assert missing.returncode == 2
+    assert "nodes node-3 do not exist" in missing.stdout
+
+    result = run_ops_pod(tmp_path, "--nodes", "node-1,node-2", "--", "uptime", events=["Running||"])
+    assert result.returncode == 0, result.stderr
+    assert "[node-1] uptime on node-1" in result.stdout.splitlines()
+    assert "Succeeded on 2 of 2 nodes" in result.stdout
+
+    usage = run_ops_pod(tmp_path, "--nodes", "node-1")
+    assert usage.returncode == 1
+    assert "--nodes requires a command" in usage.stdout
+
+
+def test_ops_pod_fan_out_existence_selector(tmp_path):
+    result = run_ops_pod(tmp_path, "--nodes", "node-role.kubernetes.io/worker", "--", "uptime", events=["Running||"])
+    assert result.returncode == 0, result.stderr
+    assert "get nodes -l node-role.kubernetes.io/worker -o jsonpath={.items[*].metadata.name}" in calls(tmp_path)
+
+
+def test_ops_pod_fan_out_interrupted(tmp_path):
+    fake_kubectl(tmp_path)
+    (tmp_path / "events").write_text("Running||\n")
+    hanging = tmp_path / "hanging"
+    hanging.mkdir()
+    env = {
+        **os.environ,
+        "PATH": f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}",
+        "FAKE_KUBECTL_DIR": str(tmp_path),
+        "FAKE_KUBECTL_HANG": "true",
+    }
+    proc = subprocess.Popen(  # nosec B603
+        [str(OPS_POD), "--nodes", "node-1,node-2", "--", "uptime"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while len(list(hanging.iterdir())) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    proc.terminate()
+    proc.wait(timeout=30)
+
+    def running(pid: str) -> bool:
+        # killed processes that nobody reaps stay around as zombies
+        stat = Path(f"/proc/{pid}/stat")
+        return stat.exists() and stat.read_text().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+
+    pids = [path.read_text().strip() for path in hanging.iterdir()]
+    assert len(pids) == 2
+    time.sleep(0.2)
+    assert not [pid for pid in pids if running(pid)]
+
+
+def test_ops_pod_prepull(tmp_path):
+    (tmp_path / "prepull").write_text(
+        "||\n"
+        "node-1||PodInitializing|\n"
+        "node-1|Completed||\n"
+        "node-1|Completed||\n"
+        "node-2||ImagePullBackOff|Back-off pulling image\n"
+        "node-3|Completed||\n"
+    )
+    result = run_ops_pod(
+        tmp_path, "--prepull", "-i", "toolbelt:1", "--start-timeout", "10m", FAKE_KUBECTL_NODES="node-1 node-2 node-3",
+    )
+    assert result.returncode == 1
+    assert "[node-1] image pulled (1/3)" in result.stdout
+    assert "[node-3] image pulled (2/3)" in result.stdout
+    assert "Image pulled on 2 of 3 nodes" in result.stdout
+    assert "Failed on node-2 (ImagePullBackOff: Back-off pulling image)" in result.stderr
+
+    daemonset = yaml.safe_load((tmp_path / "manifest").read_text())
+    assert daemonset["kind"] == "DaemonSet"
+    spec = daemonset["spec"]["template"]["spec"]
+    terms = spec["affinity"]["nodeAffinity"]["requiredDuringSchedulingIgnoredDuringExecution"]["nodeSelectorTerms"]
+    assert terms[0]["matchFields"][0]["values"] == ["node-1", "node-2", "node-3"]
+    assert spec["initContainers"][0]["image"] == "toolbelt:1"
+    assert [(c["image"], c["command"]) for c in spec["containers"]] == [("toolbelt:1", ["sleep", "infinity"])]
+    assert spec["tolerations"] == [{"operator": "Exists"}]
+    log = calls(tmp_path)
+    assert "--watch --request-timeout=10m" in log[-2]
+    assert log[-1] == f"-n fake-namespace delete daemonset {daemonset['metadata']['name']} --wait=false"
+
+
+def test_ops_pod_prepull_reports_missing_nodes(tmp_path):
+    (tmp_path / "prepull").write_text("node-1|Completed||\n")
+    result = run_ops_pod(tmp_path, "--prepull", "--nodes", "node-1,node-2", "--start-timeout", "1s")
+    assert result.returncode == 1
+    assert "Image pulled on 1 of 2 nodes" in result.stdout
+    assert "Failed on node-2 (not pulled after 1s)" in result.stderr
+
+
+@pytest.mark.parametrize("images, expected", [
+    ("other:1 toolbelt:1", "Image toolbelt:1 is present on node-1"),
+    ("other:1", "Image toolbelt:1 is not listed on node-1"),
+])
+def test_ops_pod_check_image(tmp_path, images, expected):
+    result = run_ops_pod(
+        tmp_path, "--check-image", "-i", "toolbelt:1", "node-1", events=["Running||"], FAKE_KUBECTL_IMAGES=images,
+    )
+    assert result.returncode == 0, result.stderr
+    assert expected in result.stdout
+
+
+@pytest.mark.parametrize("pulled, pull_ms", [
+    ('Successfully pulled image "toolbelt" in 2.345s (2.345s including waiting). Image size: 1 bytes.', 2345),
+    ('Successfully pulled image "toolbelt" in 1m2.5s (1m2.5s including waiting)', 62500),
+    ('Successfully pulled image "toolbelt" in 850.3ms (850.3ms including waiting)', 850),
+    ('Container image "toolbelt" already present on machine', 0),
+])
+def test_ops_pod_timings(tmp_path, pulled, pull_ms):
+    timings_log = tmp_path / "timings.jsonl"
+    for _ in range(2):
+        result = run_ops_pod(
+            tmp_path, "--timings-log", str(timings_log), "-n", "ops", "-i", 'tool"belt\\1', "node-1",
+            events=["Pending||||", "Pending|ContainerCreating||node-1|", "Running|||node-1|"],
+            FAKE_KUBECTL_PULLED=pulled,
+        )
+        assert result.returncode == 0, result.stderr
+    assert "ops-pod timings in ms" in result.stdout
+    assert f"  image_pull       {pull_ms:>8}" in result.stdout
+
+    entries = [json.loads(line) for line in timings_log.read_text().splitlines()]
+    assert len(entries) == 2
+    entry = entries[-1]
+    assert {k: entry[k] for k in ("context", "namespace", "node", "image", "reused")} == {
+        "context": "fake", "namespace": "ops", "node": "node-1", "image": 'tool"belt\\1', "reused": False,
+    }
+    phases = entry["phases_ms"]
+    assert list(phases) == ["node_lookup", "delete", "create", "scheduled", "container_start", "image_pull", "exec"]
+    assert phases["image_pull"] == pull_ms
+    # image_pull overlaps container_start, all other phases follow each other
+    assert entry["total_ms"] == sum(ms for phase, ms in phases.items() if phase != "image_pull")
+    log = calls(tmp_path)
+    events = [i for i, call in enumerate(log) if "get events --field-selector involvedObject.uid=uid-1," in call]
+    probe = [i for i, call in enumerate(log) if call.endswith(" -- true")]
+    interactive = [i for i, call in enumerate(log) if " exec -ti " in call]
+    assert events[-1] < probe[-1] < interactive[-1]
+
+
+def test_ops_pod_timings_start_with_the_node(tmp_path):
+    result = run_ops_pod(tmp_path, "--timings", "node-1", events=["Running|||node-1|"], FAKE_KUBECTL_CONFIG_DELAY="1")
+    assert result.returncode == 0, result.stderr
+    node_lookup = next(line for line in result.stdout.splitlines() if line.startswith("  node_lookup "))
+    # The lookup of the default namespace is not part of the node lookup
+    assert int(node_lookup.split()[1]) < 1000
+
+
+@pytest.mark.parametrize("args", [
+    ("--nodes", "node-1", "--", "uptime"),
+    ("--prepull",),
+])
+def test_ops_pod_timings_single_node_only(tmp_path, args):
+    result = run_ops_pod(tmp_path, "--timings", *args)
+    assert result.returncode == 1
+    assert "--timings" in result.stdout.splitlines()[0]
+    assert not (tmp_path / "calls").exists()
@@ -0,0 +1,51 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import pstats
+import time
+
+from generator import models as m
+from generator import profiling
+
+
+def test_profiler_phases_and_report(capsys):
+    with profiling.Profiler.run("test", time.perf_counter(), enabled=True) as profiler:
+        with profiler.phase("work"):
+            pass
+        assert profiler.timed("components", "bash", lambda x: x * 2, 21) == 42
+    out = capsys.readouterr().out
+    assert out.startswith("Profile of test:\n  phases:\n")
+    assert "    start-up (CPU time estimate)" in out
+    assert "    settings" in out and "    work" in out
+    assert "  components:\n    bash" in out
+
+
+def test_profiler_dumps_pstats(tmp_path, capsys):
+    output = tmp_path / "profile.pstats"
+    with profiling.Profiler.run("test", time.perf_counter(), enabled=False, output=output) as profiler:
+        assert profiler.enabled
+        sorted(range(10))
+    assert f"written to {output}" in capsys.readouterr().out
+    assert pstats.Stats(str(output)).total_calls > 0
+
+
+def test_profiler_reports_validators(capsys):
+    with profiling.Profiler.run("test", time.perf_counter(), enabled=True):
+        m.CurlItemList(name="curl", items=[
+            {"name": "kubectl", "from": "https://dl.k8s.io/release/${VERSION}/bin/kubectl", "version": "v1"},
+        ])
+    out = capsys.readouterr().out
+    validators = out.split("  validators:\n", 1)[1]
+    for name in [
+        "ShellAwareHttpUrl.validate", "CurlItem.template_url", "CurlItem.fill_to_if_empty", "CurlItem.fill_command",
+    ]:
+        assert f"    {name} " in validators
+
+
+def test_validator_functions():
+    validators = set(profiling.validator_functions(m).values())
+    assert {"ShellAwareHttpUrl.validate", "CurlItem.fill_command", "package_name_string_validator"} <= validators
+    assert "CurlItem.dump_ghelp" not in validators
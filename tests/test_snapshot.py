@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+from pathlib import Path
+
+import yaml
+
+from generator import snapshot
+from generator.models import Dockerfile
+
+
+def make_config(tmp_path: Path) -> bytes:
+    source = tmp_path / "script"
+    source.write_text("echo hi")
+    return yaml.safe_dump([
+        {"name": "arg", "items": ["TARGETARCH"]},
+        {
+            "name": "apt-get",
+            "acceleration": {"proxy_arg": "APT_PROXY"},
+            "items": ["jq", {"name": "dnsutils", "provides": ["dig", "nslookup"]}],
+        },
+        {
+            "name": "curl",
+            "reorderable": True,
+            "items": [{
+                "name": "tool",
+                "version": "v1",
+                "from": "https://example.com/{version}/tool-${TARGETARCH}",
+                "artifacts": ["/usr/local/bin/tool"],
+                "info": "first line\nsecond line",
+            }],
+        },
+        {"name": "bash", "items": ["echo one", {"name": "two", "command": "echo two"}]},
+        {"name": "env", "items": ["A=b"]},
+        {"name": "copy", "items": [{"name": "script", "from": str(source), "to": "/s"}]},
+    ]).encode("utf-8")
+
+
+def test_snapshot_restores_identical_components(tmp_path):
+    config = make_config(tmp_path)
+    raw = yaml.safe_load(config)
+    components = Dockerfile(dockerfile_file=Path("/dev/null"), components=raw).components
+
+    snapshot.Snapshot.build(config, raw, components).save(tmp_path / "snapshot.json")
+    loaded = snapshot.Snapshot.load(tmp_path / "snapshot.json")
+
+    assert loaded is not None and loaded.matches(config)
+    restored = loaded.restore()
+    assert restored == components
+    assert [type(c) for c in restored] == [type(c) for c in components]
+    assert isinstance(restored[2].items[0].to, Path)
+    assert restored[1].to_dockerfile_directive() == components[1].to_dockerfile_directive()
+
+
+def test_snapshot_matches(tmp_path, monkeypatch, subtests):
+    config = make_config(tmp_path)
+    raw = yaml.safe_load(config)
+    components = Dockerfile(dockerfile_file=Path("/dev/null"), components=raw).components
+    taken = snapshot.Snapshot.build(config, raw, components)
+
+    with subtests.test("Changed config"):
+        assert not taken.matches(config + b"\n")
+    with subtests.test("Changed models"):
+        monkeypatch.setattr(snapshot, "SCHEMA_VERSION", "other")
+        assert not taken.matches(config)
+        monkeypatch.undo()
+    with subtests.test("Changed copy source"):
+        (tmp_path / "script").write_text("echo bye")
+        assert not taken.matches(config)
+
+
+def test_snapshot_load_invalid(tmp_path):
+    assert snapshot.Snapshot.load(tmp_path / "missing.json") is None
+    (tmp_path / "broken.json").write_text("{}")
+    assert snapshot.Snapshot.load(tmp_path / "broken.json") is None
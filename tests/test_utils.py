@@ -4,6 +4,9 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import pytest
+from pydantic import ValidationError
+
 import generator.utils as u
 import generator.models as m
 
@@ -326,3 +329,177 @@ def test_grouped_components_to_dockerfile_layers(mocker, subtests):
         m.DockerfileLayer(key="ENV", commands=["ENV A=B C=D"]),
         m.DockerfileLayer(key="RUN", commands=["RUN pwd"]),
     ]
+
+
+def test_component_volatility():
+    assert u.component_volatility(m.BashItemList(name="bash", items=["pwd"])) == 0
+    assert u.component_volatility(m.EnvItemList(name="env", items=["A=B"])) == 0
+    assert u.component_volatility(
+        m.CurlItemList(
+            name="curl",
+            items=[
+                {"name": "a", "version": "1.0", "from": "https://example.com/a"},
+                {"name": "b", "from": "https://example.com/b"},
+            ],
+        )
+    ) == 1
+
+
+def test_plan_components():
+    apt = m.AptGetItemList(name="apt-get", items=["curl"])
+    curl = m.CurlItemList(
+        name="curl",
+        reorderable=True,
+        items=[{"name": "kubectl", "version": "v1", "from": "https://example.com/{version}"}],
+    )
+    static = m.BashItemList(name="bash", reorderable=True, items=["echo static"])
+    locale = m.BashItemList(name="bash", items=["locale-gen"])
+    env = m.EnvItemList(name="env", items=["A=B"])
+    info = m.InfoGenerator(components=[])
+
+    directives = [apt, curl, locale, static, env, info]
+    planned = u.plan_components(directives)
+    assert planned == [apt, locale, env, static, curl, info]
+    assert u.plan_components([apt, locale]) == [apt, locale]
+
+    before = u.layer_invalidation_estimate(directives)
+    after = u.layer_invalidation_estimate(planned)
+    assert before["kubectl version bump"] == 3
+    assert after["kubectl version bump"] == 1
+    assert after["apt-get"] == 3
+
+    plan = u.format_layer_plan(directives, planned)
+    assert "kubectl version bump  3 -> 1" in plan
+
+
+def test_plan_components_constraints(subtests):
+    apt = m.AptGetItemList(name="apt-get", items=["curl"])
+    curl = m.CurlItemList(
+        name="curl",
+        reorderable=True,
+        after=["apt-get"],
+        items=[{"name": "kubectl", "version": "v1", "from": "https://example.com/{version}"}],
+    )
+    static = m.BashItemList(name="bash", reorderable=True, items=["echo static"])
+    locale = m.BashItemList(name="bash", items=[{"name": "locale", "command": "locale-gen"}])
+    completion = m.BashItemList(
+        name="bash",
+        after=["kubectl"],
+        items=["kubectl completion bash > /etc/bash_completion.d/kubectl"],
+    )
+    info = m.InfoGenerator(components=[])
+
+    with subtests.test("Constraints that the moves keep are no obstacle"):
+        planned = u.plan_components([apt, curl, locale, static, info])
+        assert planned == [apt, locale, static, curl, info]
+
+    with subtests.test("A component that is not moved and uses a download blocks its move"):
+        directives = [apt, curl, locale, completion, static, info]
+        assert u.plan_components(directives) == [apt, curl, locale, completion, static, info]
+
+    with subtests.test("Moved components keep their order among each other"):
+        first = curl.model_copy(update={"before": ["static"]})
+        static_named = m.BashItemList(
+            name="bash", reorderable=True, items=[{"name": "static", "command": "echo static"}]
+        )
+        assert u.plan_components([apt, first, locale, static_named, info]) == [
+            apt, locale, first, static_named, info,
+        ]
+
+    with subtests.test("A config that breaks its constraints is rejected"):
+        with pytest.raises(ValueError, match="break their ordering constraints: curl before bash"):
+            u.plan_components([apt, completion, curl, info])
+        with pytest.raises(ValueError, match="unknown name: helm"):
+            u.plan_components([apt, curl.model_copy(update={"after": ["helm"]}), info])
+
+
+def test_split_download_stages():
+    arg = m.ArgItemList(name="arg", items=["TARGETARCH"])
+    curl = m.CurlItemList(
+        name="curl",
+        items=[
+            {"name": "kubectl", "from": "https://example.com/${TARGETARCH}/kubectl"},
+            {"name": "kubetail", "from": "https://example.com/kubetail"},
+        ],
+    )
+    bash = m.BashItemList(name="bash", items=["pwd"])
+
+    stages, directives = u.split_download_stages([arg, curl, bash], "base")
+    assert stages == [
+        "FROM base AS download-kubectl\nUSER root\nWORKDIR /\nARG TARGETARCH\n"
+        "RUN curl -sLf https://example.com/${TARGETARCH}/kubectl -o /bin/kubectl && chmod 755 /bin/kubectl",
+        "FROM base AS download-kubetail\nUSER root\nWORKDIR /\nARG TARGETARCH\n"
+        "RUN curl -sLf https://example.com/kubetail -o /bin/kubetail && chmod 755 /bin/kubetail",
+    ]
+    assert directives == [arg, m.CurlStageCopyList(items=curl.items), bash]
+
+    df = m.Dockerfile(dockerfile_file="/dev/null", from_image="final", components=[])
+    assert df.to_dockerfile(u.directives_to_layers(directives), stages[:1]) == (
+        f"{stages[0]}\n\n"
+        "FROM final\n"
+        "ARG TARGETARCH\n"
+        "COPY --from=download-kubectl /bin/kubectl /bin/kubectl\n"
+        "COPY --from=download-kubetail /bin/kubetail /bin/kubetail\n"
+        "RUN pwd"
+    )
+
+
+def test_split_download_stages_rejects_duplicate_stage_names():
+    curl = m.CurlItemList(
+        name="curl",
+        items=[
+            {"name": "kube_tool", "from": "https://example.com/a", "to": "/bin/a"},
+            {"name": "kube-tool", "from": "https://example.com/b", "to": "/bin/b"},
+        ],
+    )
+    with pytest.raises(ValueError, match="download-kube-tool"):
+        u.split_download_stages([curl], "base")
+
+
+def test_bake_on_demand_tools(tmp_path):
+    for script in ("install_a", "install_b", "install_c", "install_d"):
+        (tmp_path / script).write_text("#!/bin/bash\n")
+    copy = m.CopyItemList(
+        name="copy",
+        items=[
+            {"name": "install_a", "from": str(tmp_path / "install_a"), "to": "/hacks",
+             "on_demand": {"binary": "a", "bake": True, "version": "v1.0.0"}},
+            {"name": "install_b", "from": str(tmp_path / "install_b"), "to": "/hacks",
+             "on_demand": {"binary": "b", "bake_variants": ["debug"], "version": "v2.0.0"}},
+            {"name": "install_c", "from": str(tmp_path / "install_c"), "to": "/hacks/install_c",
+             "on_demand": {"binary": "c", "version": "v3.0.0"}},
+            {"name": "install_d", "from": str(tmp_path / "install_d"), "to": "/hacks",
+             "on_demand": {"binary": "d"}},
+        ],
+    )
+    bash = m.BashItemList(name="bash", items=["pwd"])
+    info = m.InfoGenerator(components=[copy])
+
+    def baked(directives):
+        return [d.items[0].command for d in directives if isinstance(d, m.BashItemList) and d is not bash]
+
+    directives = u.bake_on_demand_tools([copy, bash, info], None)
+    assert baked(directives) == ["/hacks/install_a --version v1.0.0"]
+    assert isinstance(directives[-1], m.InfoGenerator)
+    assert not directives[2].can_be_combined and not directives[-1].can_be_combined
+    assert u.bake_on_demand_tools([bash, info], None) == [bash, info]
+
+    directives = u.bake_on_demand_tools([copy, bash, info], "debug", ["c"])
+    assert baked(directives) == [
+        "/hacks/install_a --version v1.0.0",
+        "/hacks/install_b --version v2.0.0",
+        "/hacks/install_c --version v3.0.0",
+    ]
+    assert [layer.commands for layer in u.directives_to_layers(directives[1:-1])] == [
+        ["RUN pwd"],
+        ["RUN /hacks/install_a --version v1.0.0"],
+        ["RUN /hacks/install_b --version v2.0.0"],
+        ["RUN /hacks/install_c --version v3.0.0"],
+    ]
+
+    with pytest.raises(ValueError, match="Unknown on-demand tools to bake: e"):
+        u.bake_on_demand_tools([copy], None, ["e"])
+    with pytest.raises(ValueError, match="On-demand tools to bake without a pinned version: d"):
+        u.bake_on_demand_tools([copy], None, ["c", "d"])
+    with pytest.raises(ValidationError, match="d is baked into the image and needs a pinned"):
+        m.OnDemandTool(binary="d", bake_variants=["debug"])
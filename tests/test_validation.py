@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+from generator import validation as v
+
+
+def make_checks(*names: str) -> list[v.ValidationCheck]:
+    return [v.ValidationCheck(name=name, command=f"{name} --version") for name in names]
+
+
+def test_serial_validation_lines():
+    assert v.serial_validation_lines(make_checks("jq")) == ["# Validate: jq", "RUN jq --version"]
+
+
+def test_load_durations(tmp_path):
+    report = tmp_path / "report.json"
+    report.write_text(json.dumps({
+        "summary": {},
+        "checks": [
+            {"name": "jq", "command": "jq --version", "status": "passed", "duration": 1.5},
+            {"name": "old", "command": "old"},
+        ],
+    }))
+    assert v.load_durations(report) == {("jq", "jq --version"): 1.5}
+
+
+def test_shard_checks_balances_by_duration():
+    checks = make_checks("a", "b", "c", "d", "e")
+    durations = {
+        ("a", "a --version"): 10.0,
+        ("b", "b --version"): 6.0,
+        ("c", "c --version"): 4.0,
+        ("d", "d --version"): 1.0,
+    }
+
+    first, first_estimate = v.shard_checks(checks, 2, 0, durations)
+    second, second_estimate = v.shard_checks(checks, 2, 1, durations)
+
+    # "e" has no recorded duration and is estimated with the median (5.0)
+    assert [c.name for c in first] == ["a", "c"]
+    assert [c.name for c in second] == ["b", "d", "e"]
+    assert (first_estimate, second_estimate) == (14.0, 12.0)
+
+
+def test_shard_checks_without_durations():
+    checks = make_checks("a", "b", "c", "d", "e")
+    shards = [v.shard_checks(checks, 3, idx)[0] for idx in range(3)]
+    assert sorted(c.name for shard in shards for c in shard) == ["a", "b", "c", "d", "e"]
+    assert [len(shard) for shard in shards] == [2, 2, 1]
+    assert v.shard_checks(checks, 1, 0) == (checks, 5.0)
+
+
+def test_skip_passed_checks(tmp_path):
+    checks = [
+        v.ValidationCheck(name="a", command="a", fingerprint="fa"),
+        v.ValidationCheck(name="b", command="b", fingerprint="fb"),
+        v.ValidationCheck(name="c", command="c", fingerprint="fc"),
+    ]
+    report = tmp_path / "report.json"
+    report.write_text(json.dumps({"checks": [
+        {"name": "a", "command": "a", "fingerprint": "fa", "status": "passed"},
+        {"name": "b", "command": "b", "fingerprint": "fb", "status": "timeout"},
+        {"name": "c", "command": "c", "status": "passed"},
+        {"name": "d", "command": "d", "fingerprint": "fd", "status": "cached"},
+    ]}))
+
+    passed = v.load_passed_fingerprints(report)
+    assert passed == {"fa", "fd"}
+    assert v.skip_passed_checks(checks, passed) == (checks[1:], checks[:1])
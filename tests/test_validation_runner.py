@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2025 SAP SE or an SAP affiliate company and Gardener contributors
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import subprocess  # nosec B404
+import sys
+import time
+
+from generator import validation_runner as r
+
+SHELL = ["/bin/bash", "-c"]
+
+
+def test_run_check(subtests):
+    with subtests.test("Passed"):
+        result = r.run_check({"name": "ok", "command": "echo hello"}, SHELL, 5)
+        assert result["status"] == "passed"
+        assert result["returncode"] == 0
+        assert result["output"] == "hello\n"
+
+    with subtests.test("Failed"):
+        result = r.run_check({"name": "ko", "command": "echo oops >&2; exit 3"}, SHELL, 5)
+        assert result["status"] == "failed"
+        assert result["returncode"] == 3
+        assert result["output"] == "oops\n"
+
+    with subtests.test("Timeout"):
+        result = r.run_check({"name": "slow", "command": "sleep 10"}, SHELL, 0.2)
+        assert result["status"] == "timeout"
+        assert result["duration"] < 5
+
+
+def test_run_checks_concurrently():
+    checks = [{"name": f"sleep{i}", "command": "sleep 0.3"} for i in range(4)]
+    start = time.monotonic()
+    results = r.run_checks(checks, workers=4, timeout=5, shell=SHELL)
+    assert time.monotonic() - start < 1.0
+    assert [res["name"] for res in results] == [c["name"] for c in checks]
+    assert all(res["status"] == "passed" for res in results)
+
+
+def test_to_junit():
+    results = [
+        {"name": "ok", "command": "true", "status": "passed", "duration": 0.1, "output": ""},
+        {"name": "a<b", "command": "x && y", "status": "failed", "duration": 0.2, "output": "<err>"},
+    ]
+    junit = r.to_junit(results, r.summarize(results, 0.3))
+    assert '<testsuite name="image-validation" tests="2" failures="1" time="0.3">' in junit
+    assert '<testcase name="a&lt;b" time="0.2">' in junit
+    assert '<failure message="failed: x &amp;&amp; y">&lt;err&gt;</failure>' in junit
+
+
+def test_main_reports_every_failure(tmp_path):
+    plan = {
+        "workers": 2,
+        "timeout": 5,
+        "shell": SHELL,
+        "report": str(tmp_path / "report.json"),
+        "junit": str(tmp_path / "report.xml"),
+        "checks": [
+            {"name": "first", "command": "exit 1"},
+            {"name": "second", "command": "true"},
+            {"name": "third", "command": "exit 2"},
+        ],
+        "cached": [{"name": "fourth", "command": "true", "duration": 2.0}],
+    }
+    (tmp_path / "plan.json").write_text(json.dumps(plan))
+
+    def run(*args: str) -> subprocess.CompletedProcess:
+        return subprocess.run(  # nosec B603
+            [sys.executable, r.__file__, *args], capture_output=True, text=True, check=False
+        )
+
+    # The report has to survive the build step, so only --verify fails
+    proc = run(str(tmp_path / "plan.json"))
+    assert proc.returncode == 0
+    assert "1/4 checks passed, 1 cached" in proc.stdout
+
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert report["summary"]["failed"] == 2
+    assert report["summary"]["cached"] == 1
+    assert [c["status"] for c in report["checks"]] == ["failed", "passed", "failed", "cached"]
+    assert report["checks"][-1]["duration"] == 2.0
+    junit = (tmp_path / "report.xml").read_text()
+    assert junit.count("<failure") == 2
+    assert junit.count("<skipped") == 1
+
+    proc = run("--verify", str(tmp_path / "report.json"))
+    assert proc.returncode == 1
+    assert "2 of 4 checks failed" in proc.stderr